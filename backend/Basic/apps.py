@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BasicConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "Basic"
+
+    def ready(self):
+        # Connects the cache invalidation receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,209 @@
+import os
+import threading
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .layer_store import get_store_root
+from .projection import HISTORY_FIELDS, PROJECTION_METHODS, GrowthParameters, _project, method_year_totals
+
+logger = logging.getLogger(__name__)
+
+# Output key of the best-fit projection in Time_series
+BEST_FIT = 'BestFit'
+
+# Written by `manage.py backtest_projection_methods` next to the GeoParquet layer store
+BACKTEST_FILE = 'projection_backtest.parquet'
+
+
+def backtest_path():
+    return os.path.join(get_store_root(), BACKTEST_FILE)
+
+
+class Backtest:
+    """
+    Every time series method fitted on the 1951-2001 censuses of every subdistrict
+    and scored against the actual 2011 census. best_method is the method with the
+    lowest absolute percentage error (None when no method could project the
+    subdistrict); predicted and error_pct hold every method's result, NaN where a
+    method cannot project the subdistrict.
+    """
+
+    def __init__(self, parameters):
+        self.parameter_version = parameters.version
+        self.codes = parameters.codes
+        self._positions = {code: i for i, code in enumerate(self.codes.tolist())}
+        history = parameters.history
+        actual = history[:, -1].astype(np.float64)
+
+        # The same formulas as the projections, fitted without the last census
+        fit = GrowthParameters(parameters.codes, history[:, :-1], parameters.years[:-1])
+        decade = np.array([[parameters.years[-1] - parameters.years[-2]]])
+        rows = np.arange(len(fit))
+        last_census = history[:, -2][:, None].astype(np.float64)
+
+        self.predicted = {}
+        self.error_pct = {}
+        for method in PROJECTION_METHODS:
+            usable = fit.usable[method] & (actual > 0)
+            predicted = np.full(len(fit), np.nan)
+            if usable.any():
+                predicted[usable] = _project(method, last_census[usable], rows[usable], decade, fit)[:, 0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.error_pct[method] = np.abs(predicted - actual) / actual * 100
+            self.predicted[method] = predicted
+
+        errors = np.column_stack([self.error_pct[method] for method in PROJECTION_METHODS])
+        errors = np.where(np.isfinite(errors), errors, np.inf)
+        best = errors.argmin(axis=1)
+        self.best_error = errors[rows, best]
+        methods = np.array(PROJECTION_METHODS, dtype=object)
+        self.best_method = np.where(np.isfinite(self.best_error), methods[best], None)
+        self.best_error = np.where(np.isfinite(self.best_error), self.best_error, np.nan)
+
+    @classmethod
+    def from_frame(cls, frame, parameters):
+        """Backtest of a stored frame (see frame()) fitted on the census history of parameters"""
+        backtest = cls.__new__(cls)
+        backtest.parameter_version = parameters.version
+        backtest.codes = parameters.codes
+        backtest._positions = {code: i for i, code in enumerate(backtest.codes.tolist())}
+        backtest.predicted = {method: frame[f'{method}_2011'].to_numpy(dtype=np.float64) for method in PROJECTION_METHODS}
+        backtest.error_pct = {method: frame[f'{method}_error_pct'].to_numpy(dtype=np.float64) for method in PROJECTION_METHODS}
+        backtest.best_method = frame['best_method'].to_numpy(dtype=object)
+        backtest.best_method = np.where(pd.isna(backtest.best_method), None, backtest.best_method)
+        backtest.best_error = frame['best_error_pct'].to_numpy(dtype=np.float64)
+        return backtest
+
+    def frame(self, history):
+        """
+        One row per subdistrict with the census history the backtest was fitted on,
+        so a stored table can be checked against the current Population_2011
+        """
+        frame = pd.DataFrame({'subdistrict_code': self.codes})
+        for j, field in enumerate(HISTORY_FIELDS):
+            frame[field] = history[:, j]
+        frame['best_method'] = pd.Series(self.best_method, dtype=object)
+        frame['best_error_pct'] = self.best_error
+        for method in PROJECTION_METHODS:
+            frame[f'{method}_2011'] = self.predicted[method]
+            frame[f'{method}_error_pct'] = self.error_pct[method]
+        return frame
+
+    def __len__(self):
+        return len(self.codes)
+
+    def codes_for(self, method):
+        """Subdistrict codes whose best-fitting method is method"""
+        return set(self.codes[self.best_method == method].tolist())
+
+    def rows(self, subdistrict_codes=None):
+        """One dict per subdistrict (optionally only the given codes), for responses and reports"""
+        if subdistrict_codes is None:
+            positions = range(len(self.codes))
+        else:
+            positions = [self._positions[code] for code in sorted(subdistrict_codes) if code in self._positions]
+        rows = []
+        for i in positions:
+            row = {
+                'subdistrict_code': self.codes[i].item(),
+                'best_method': self.best_method[i],
+                'best_error_pct': _number(self.best_error[i]),
+            }
+            for method in PROJECTION_METHODS:
+                row[f'{method}_2011'] = _number(self.predicted[method][i])
+                row[f'{method}_error_pct'] = _number(self.error_pct[method][i])
+            rows.append(row)
+        return rows
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def write_backtest(parameters):
+    """
+    Backtests every subdistrict of parameters and writes the table next to the
+    GeoParquet layer store. Returns (backtest, path).
+    """
+    backtest = Backtest(parameters)
+    path = backtest_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a half-written table
+    tmp_path = path + '.tmp'
+    backtest.frame(parameters.history).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote projection backtest {path} ({len(backtest)} subdistricts)")
+    return backtest, path
+
+
+def load_backtest(parameters):
+    """
+    The stored Backtest, or None when the table has not been written or was
+    fitted on another census history than parameters (run
+    `manage.py backtest_projection_methods`)
+    """
+    path = backtest_path()
+    if not os.path.exists(path):
+        return None
+    frame = pd.read_parquet(path)
+    # A table written for other methods or another census history is stale
+    columns = ['subdistrict_code', 'best_method', 'best_error_pct', *HISTORY_FIELDS]
+    columns += [f'{method}_{suffix}' for method in PROJECTION_METHODS for suffix in ('2011', 'error_pct')]
+    stale = not set(columns) <= set(frame.columns) or len(frame) != len(parameters.codes)
+    if not stale:
+        # Rows in the order of parameters (Population_2011 rows come in no fixed order)
+        frame = frame.set_index('subdistrict_code').reindex(parameters.codes)
+        history = frame[HISTORY_FIELDS]
+        stale = history.isna().any(axis=None) or not np.array_equal(history.to_numpy(dtype=np.int64), parameters.history)
+    if stale:
+        logger.warning(f"{path} does not match the current Population_2011; backtesting in process")
+        return None
+    return Backtest.from_frame(frame, parameters)
+
+
+_backtest = None
+_backtest_lock = threading.Lock()
+
+
+def get_backtest(parameters):
+    """
+    The Backtest of the given GrowthParameters: the stored table when it was
+    fitted on the same census history, else backtested in process. Kept once
+    per parameter version, so a Population_2011 change, which recomputes the
+    parameters, checks the table again.
+    """
+    global _backtest
+    backtest = _backtest
+    if backtest is None or backtest.parameter_version != parameters.version:
+        with _backtest_lock:
+            if _backtest is None or _backtest.parameter_version != parameters.version:
+                _backtest = load_backtest(parameters)
+                if _backtest is None:
+                    _backtest = Backtest(parameters)
+                    logger.info(f"Backtested projection methods for {len(_backtest)} subdistricts")
+            backtest = _backtest
+    return backtest
+
+
+def best_fit_year_totals(base_year, years, villages, parameters, subdistricts=None, exact=True, memo=None):
+    """
+    (base_population, year_totals) as method_year_totals, projecting the villages
+    of every subdistrict with that subdistrict's best-fitting method
+    """
+    backtest = get_backtest(parameters)
+    base_population = 0
+    year_totals = np.zeros(len(years), dtype=np.int64 if exact else np.float64)
+    for method in PROJECTION_METHODS:
+        codes = backtest.codes_for(method)
+        if subdistricts is not None:
+            codes &= set(subdistricts)
+        if not codes:
+            continue
+        method_base, method_totals = method_year_totals(
+            method, base_year, years, villages, parameters, codes, exact, memo
+        )
+        base_population += method_base
+        year_totals = year_totals + method_totals
+    return base_population, year_totals
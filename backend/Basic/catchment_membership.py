@@ -0,0 +1,173 @@
+import os
+import threading
+import logging
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from django.conf import settings
+
+from .layer_cache import layer_mtime, load_layer
+from .layer_query import load_layer_query
+from .layer_store import get_store_root
+
+logger = logging.getLogger(__name__)
+
+# Drain based approach layers, relative to MEDIA_ROOT
+CATCHMENT_LAYER = os.path.join('Drain_shp', 'Catchments', 'Catchment.shp')
+VILLAGE_LAYER = os.path.join('Drain_shp', 'Villages', 'basin_village.shp')
+
+MEMBERSHIP_FILE = 'catchment_village_membership.parquet'
+
+
+def catchment_layer_path():
+    return os.path.join(settings.MEDIA_ROOT, CATCHMENT_LAYER)
+
+
+def village_layer_path():
+    return os.path.join(settings.MEDIA_ROOT, VILLAGE_LAYER)
+
+
+def membership_path():
+    return os.path.join(get_store_root(), MEMBERSHIP_FILE)
+
+
+def source_mtime():
+    return max(layer_mtime(catchment_layer_path()), layer_mtime(village_layer_path()))
+
+
+def membership_frame(catchment_gdf, village_gdf, catchment_rows, village_rows):
+    """
+    Membership rows for the given (catchment row, village row) pairs: the overlap
+    area in square metres and the share of the village area inside the catchment.
+    Both frames must be in EPSG:4326, as served by the layer cache.
+    """
+    # Areas in metres: pair geometries projected to the UTM zone covering the villages
+    area_crs = village_gdf.estimate_utm_crs()
+    catchments = gpd.GeoSeries(catchment_gdf.geometry.values[catchment_rows], crs="EPSG:4326").to_crs(area_crs).values
+    villages = gpd.GeoSeries(village_gdf.geometry.values[village_rows], crs="EPSG:4326").to_crs(area_crs).values
+    intersection_area = shapely.area(shapely.intersection(catchments, villages))
+    village_area = shapely.area(villages)
+    village_fraction = np.divide(
+        intersection_area, village_area, out=np.zeros_like(intersection_area), where=village_area > 0
+    )
+
+    shape_ids = (village_gdf['shapeID'].to_numpy()[village_rows] if 'shapeID' in village_gdf.columns
+                 else np.full(len(village_rows), None, dtype=object))
+    return pd.DataFrame({
+        'Drain_No': catchment_gdf['Drain_No'].to_numpy()[catchment_rows],
+        'shapeID': shape_ids,
+        'intersection_area': intersection_area,
+        'village_fraction': np.clip(village_fraction, 0.0, 1.0),
+        'catchment_row': np.asarray(catchment_rows, dtype=np.int64),
+        'village_row': np.asarray(village_rows, dtype=np.int64),
+    })
+
+
+def compute_membership(catchment_gdf, village_gdf):
+    """Membership rows of every intersecting pair, sorted by catchment row and then village row"""
+    catchments = catchment_gdf.geometry.values
+    shapely.prepare(catchments)
+    catchment_rows, village_rows = shapely.STRtree(village_gdf.geometry.values).query(
+        catchments, predicate='intersects'
+    )
+    order = np.lexsort((village_rows, catchment_rows))
+    return membership_frame(catchment_gdf, village_gdf, catchment_rows[order], village_rows[order])
+
+
+def write_membership():
+    """
+    Computes the membership table from the current layers and writes it next to
+    the GeoParquet layer store. Returns (path, row_count).
+    """
+    # Repaired geometries keep intersection() from failing on self-intersecting rings
+    frame = compute_membership(
+        load_layer(catchment_layer_path(), repair=True),
+        load_layer(village_layer_path(), repair=True),
+    )
+    path = membership_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a half-written table
+    tmp_path = path + '.tmp'
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote catchment/village membership {path} ({len(frame)} pairs)")
+    return path, len(frame)
+
+
+class CatchmentMembership:
+    """Loaded membership table, with row lookups by catchment"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.catchment_rows = frame['catchment_row'].to_numpy()
+        self.village_rows = frame['village_row'].to_numpy()
+
+    def rows_for_catchments(self, catchment_rows):
+        """Table rows of the given catchment rows, in the order given (the table is sorted by catchment)"""
+        starts = np.searchsorted(self.catchment_rows, catchment_rows, side='left')
+        ends = np.searchsorted(self.catchment_rows, catchment_rows, side='right')
+        ranges = [np.arange(start, end) for start, end in zip(starts, ends)]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+
+_membership = None
+_membership_lock = threading.Lock()
+
+
+def load_membership():
+    """
+    Returns the precomputed CatchmentMembership, or None when the table has not
+    been built or is older than either layer (run `manage.py build_catchment_membership`).
+    """
+    global _membership
+    path = membership_path()
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if mtime < source_mtime():
+        return None
+
+    with _membership_lock:
+        if _membership is None or _membership[0] != mtime:
+            _membership = (mtime, CatchmentMembership(pd.read_parquet(path)))
+        return _membership[1]
+
+
+def intersecting_pairs(catchment_gdf, catchment_rows):
+    """
+    (catchment_rows, village_rows) of every intersecting catchment/village pair for
+    the given ascending catchment rows, in catchment order then village order.
+    Served from the membership table when it is fresh, else by a live STRtree query.
+    """
+    membership = load_membership()
+    if membership is not None:
+        rows = membership.rows_for_catchments(catchment_rows)
+        return membership.catchment_rows[rows], membership.village_rows[rows]
+
+    _, village_index = load_layer_query(village_layer_path())
+    catchments = catchment_gdf.geometry.values[catchment_rows]
+    shapely.prepare(catchments)
+    pair_catchments, village_rows = village_index.tree.query(catchments, predicate='intersects')
+    order = np.lexsort((village_rows, pair_catchments))
+    return catchment_rows[pair_catchments[order]], village_rows[order]
+
+
+def catchment_overlaps(catchment_gdf, catchment_rows):
+    """
+    Membership rows (see membership_frame) for the given ascending catchment rows.
+    Served from the membership table when it is fresh, else computed for just
+    these catchments with vectorized intersection/area over the STRtree pairs.
+    """
+    membership = load_membership()
+    if membership is not None:
+        return membership.frame.iloc[membership.rows_for_catchments(catchment_rows)]
+
+    pair_catchments, pair_villages = intersecting_pairs(catchment_gdf, catchment_rows)
+    # Repaired geometries keep intersection() from failing on self-intersecting rings
+    return membership_frame(
+        load_layer(catchment_layer_path(), repair=True),
+        load_layer(village_layer_path(), repair=True),
+        pair_catchments, pair_villages,
+    )
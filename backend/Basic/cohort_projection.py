@@ -0,0 +1,224 @@
+import re
+import logging
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Row blocks of the cohort state: every age group for females, then for males
+GENDERS = ('female', 'male')
+
+# Annual births per woman by the first age of her age group (a total fertility rate of about 2.1);
+# 50 closes the schedule, and fertility is zero past its last key
+DEFAULT_FERTILITY = {15: 0.030, 20: 0.130, 25: 0.125, 30: 0.075, 35: 0.035, 40: 0.012, 45: 0.003, 50: 0.0}
+
+# Annual survival probability by the first age of the age group; ages between
+# the keys take the value of the key below them
+DEFAULT_SURVIVAL = {
+    'female': {0: 0.9930, 5: 0.9993, 15: 0.9989, 30: 0.9982, 45: 0.9955, 55: 0.9900, 65: 0.9780, 75: 0.9450, 85: 0.8700},
+    'male': {0: 0.9925, 5: 0.9992, 15: 0.9984, 30: 0.9972, 45: 0.9930, 55: 0.9850, 65: 0.9700, 75: 0.9350, 85: 0.8550},
+}
+
+# Male births per female birth
+DEFAULT_SEX_RATIO_AT_BIRTH = 1.08
+
+# Longest projection from the latest stored cohort year
+MAX_COHORT_YEARS = 100
+
+_AGE_GROUP = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+)|\+|.*above.*)?\s*$', re.IGNORECASE)
+
+
+def parse_age_group(label):
+    """(first_age, last_age) of an age group label such as "0-4"; last_age is None for "80+" or "80 & above" """
+    match = _AGE_GROUP.match(str(label))
+    if not match:
+        raise ValueError(f"Unrecognised age group {label!r}")
+    first = int(match.group(1))
+    if match.group(2) is not None:
+        last = int(match.group(2))
+        if last < first:
+            raise ValueError(f"Unrecognised age group {label!r}")
+        return first, last
+    if str(label).strip().isdigit():
+        return first, first
+    return first, None
+
+
+def _by_first_age(schedule, first_ages, default, closed=False):
+    """
+    Schedule value of every age group: keys are first ages (or age group labels),
+    the value of the nearest key at or below. A closed schedule gives default to
+    groups starting past its last key: "45-49" ends at 49, a plain 45 at 45, and an
+    open "45+" never ends.
+    """
+    points = sorted((parse_age_group(key), float(value)) for key, value in schedule.items())
+    end = points[-1][0][1] if closed and points else None
+    values = []
+    for first in first_ages:
+        below = [value for (age, _), value in points if age <= first]
+        if not below or (end is not None and first > end):
+            values.append(default)
+        else:
+            values.append(below[-1])
+    return np.array(values)
+
+
+class CohortSchedules:
+    """
+    Annual fertility, survival and net migration schedules of a cohort-component
+    projection. fertility maps age groups (or their first ages) to births per woman
+    per year; survival and migration map gender to such a schedule of probabilities
+    and net migration rates per person per year.
+    """
+
+    def __init__(self, fertility=None, survival=None, migration=None, sex_ratio_at_birth=DEFAULT_SEX_RATIO_AT_BIRTH):
+        self.fertility = DEFAULT_FERTILITY if fertility is None else fertility
+        self.survival = {gender: (survival or {}).get(gender, DEFAULT_SURVIVAL[gender]) for gender in GENDERS}
+        self.migration = {gender: (migration or {}).get(gender, {}) for gender in GENDERS}
+        self.sex_ratio_at_birth = float(sex_ratio_at_birth)
+        if self.sex_ratio_at_birth <= 0:
+            raise ValueError('sex_ratio_at_birth must be positive')
+
+    @classmethod
+    def from_request(cls, data):
+        """CohortSchedules of the optional "schedules" object of a request; raises ValueError when malformed"""
+        if not data:
+            return cls()
+        if not isinstance(data, dict):
+            raise ValueError('schedules must be an object')
+        if not isinstance(data.get('fertility', {}), dict):
+            raise ValueError('schedules.fertility must map age groups to rates')
+        for key in ('survival', 'migration'):
+            schedule = data.get(key, {})
+            if not (isinstance(schedule, dict) and set(schedule) <= set(GENDERS)
+                    and all(isinstance(rates, dict) for rates in schedule.values())):
+                raise ValueError(f'schedules.{key} must map female/male to a schedule')
+        return cls(
+            data.get('fertility'), data.get('survival'), data.get('migration'),
+            data.get('sex_ratio_at_birth', DEFAULT_SEX_RATIO_AT_BIRTH),
+        )
+
+    def rates(self, first_ages):
+        """(fertility (groups,), survival (genders x groups), migration (genders x groups))"""
+        fertility = _by_first_age(self.fertility, first_ages, 0.0, closed=True)
+        survival = np.vstack([_by_first_age(self.survival[gender], first_ages, 1.0) for gender in GENDERS])
+        migration = np.vstack([_by_first_age(self.migration[gender], first_ages, 0.0) for gender in GENDERS])
+        if (fertility < 0).any() or ((survival < 0) | (survival > 1)).any() or (migration <= -1).any():
+            raise ValueError('fertility must be >= 0, survival within [0, 1] and migration > -1')
+        return fertility, survival, migration
+
+
+class AgeGroups:
+    """Age group labels sorted by first age, with the years each group spans (None for the open last group)"""
+
+    def __init__(self, labels):
+        parsed = sorted((parse_age_group(label), label) for label in set(labels))
+        self.labels = [label for _, label in parsed]
+        self.first_ages = [first for (first, _), _ in parsed]
+        self.widths = [None if last is None else last - first + 1 for (first, last), _ in parsed]
+        self._rows = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def row(self, label, gender):
+        """State row of an age group and gender ("female"/"male")"""
+        return GENDERS.index(gender) * len(self.labels) + self._rows[label]
+
+
+def transition_matrix(age_groups, schedules):
+    """
+    Sparse one-year Leslie matrix over (gender, age group) rows. Survivors of a
+    group of width w stay with probability 1 - 1/w and move up one group with
+    probability 1/w (the last group keeps its survivors), net migration scales
+    every group by (1 + rate), and the births of the female groups enter the
+    first group of each gender by the sex ratio at birth, discounted by its survival.
+    """
+    count = len(age_groups)
+    fertility, survival, migration = schedules.rates(age_groups.first_ages)
+    rows, cols, values = [], [], []
+    for g in range(len(GENDERS)):
+        offset = g * count
+        for i, width in enumerate(age_groups.widths):
+            kept = survival[g, i] * (1 + migration[g, i])
+            moving = 0.0 if width is None or i == count - 1 else 1.0 / width
+            rows.append(offset + i)
+            cols.append(offset + i)
+            values.append(kept * (1 - moving))
+            if moving:
+                rows.append(offset + i + 1)
+                cols.append(offset + i)
+                values.append(kept * moving)
+
+    female_share = 1 / (1 + schedules.sex_ratio_at_birth)
+    for g, share in enumerate((female_share, 1 - female_share)):
+        for i in np.flatnonzero(fertility).tolist():
+            rows.append(g * count)
+            cols.append(i)
+            values.append(fertility[i] * share * survival[g, 0])
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(GENDERS) * count,) * 2)
+
+
+def cohort_state(records):
+    """
+    (age_groups, village_codes, state) of (village_code, age_group, gender, population)
+    records: state holds one column per village and one row per gender and age
+    group. Genders other than male/female are left out, as in CohortView, and so
+    are labels that are not age groups (such as a stored "Total").
+    """
+    records = [(village, age_group, str(gender).lower(), population)
+               for village, age_group, gender, population in records
+               if str(gender).lower() in GENDERS and _AGE_GROUP.match(str(age_group))]
+    age_groups = AgeGroups(age_group for _, age_group, _, _ in records)
+    village_codes = sorted({village for village, _, _, _ in records})
+    columns = {village: j for j, village in enumerate(village_codes)}
+    state = np.zeros((len(GENDERS) * len(age_groups), len(village_codes)))
+    for village, age_group, gender, population in records:
+        state[age_groups.row(age_group, gender), columns[village]] += population or 0
+    return age_groups, village_codes, state
+
+
+def project_cohorts(state, matrix, steps):
+    """Yields (step, state) for steps 1..steps, advancing every village column one year per matrix product"""
+    for step in range(1, steps + 1):
+        state = matrix @ state
+        yield step, state
+
+
+def age_pyramid(age_groups, totals):
+    """CohortView's {age_group: {"male", "female", "total"}, "total": {...}} of per-row totals"""
+    count = len(age_groups)
+    female = np.rint(totals[:count]).astype(np.int64).tolist()
+    male = np.rint(totals[count:]).astype(np.int64).tolist()
+    pyramid = {
+        label: {'male': m, 'female': f, 'total': m + f}
+        for label, f, m in zip(age_groups.labels, female, male)
+    }
+    if pyramid:
+        pyramid['total'] = {'male': sum(male), 'female': sum(female), 'total': sum(male) + sum(female)}
+    return pyramid
+
+
+def cohort_pyramids(records, base_year, years, schedules=None):
+    """
+    {year: age pyramid} for every year in years after base_year, projecting the
+    base_year records of all villages together with one sparse matrix product per year
+    """
+    targets = sorted({int(year) for year in years if int(year) > base_year})
+    if not targets:
+        return {}
+    if targets[-1] - base_year > MAX_COHORT_YEARS:
+        raise ValueError(f'cohorts are projected at most {MAX_COHORT_YEARS} years past {base_year}')
+    age_groups, village_codes, state = cohort_state(records)
+    if not len(age_groups):
+        return {year: {} for year in targets}
+    matrix = transition_matrix(age_groups, schedules or CohortSchedules())
+    logger.info(f"Projecting {len(village_codes)} villages x {len(age_groups)} age groups from {base_year} to {targets[-1]}")
+
+    wanted = set(targets)
+    pyramids = {}
+    for step, projected in project_cohorts(state, matrix, targets[-1] - base_year):
+        if base_year + step in wanted:
+            pyramids[base_year + step] = age_pyramid(age_groups, projected.sum(axis=1))
+    return pyramids
@@ -0,0 +1,180 @@
+import gzip
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .layer_cache import layer_mtime
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip and identity are always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Responses are compressed once and served many times, but the first request for a
+# full-resolution layer pays for it; these levels keep most of the ratio at a fraction of the time
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 6
+
+
+def encode_geojson(data):
+    """Serializes a GeoDataFrame or a GeoJSON dict to compact UTF-8 bytes"""
+    if hasattr(data, 'to_json'):
+        text = data.to_json(ensure_ascii=False, separators=(',', ':'))
+    else:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return text.encode('utf-8')
+
+
+def compress_variants(body):
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts (q > 0), from its Accept-Encoding header"""
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class GeoJSONBytesCache:
+    """
+    LRU cache of final GeoJSON response bodies (identity, gzip and brotli),
+    keyed by layer version and request parameters.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached variants for key, calling build() on a miss.
+        build() returns a GeoDataFrame or GeoJSON dict, or None when there is
+        nothing to serve; None results are not cached.
+        """
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return variants
+            self.misses += 1
+
+        data = build()
+        if data is None:
+            return None
+        variants = compress_variants(encode_geojson(data))
+        nbytes = sum(len(body) for body in variants.values())
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= sum(len(body) for body in old.values())
+            self._entries[key] = variants
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= sum(len(body) for body in evicted.values())
+        return variants
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'responses': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_geojson_cache = None
+_geojson_cache_lock = threading.Lock()
+
+
+def get_geojson_cache():
+    global _geojson_cache
+    if _geojson_cache is None:
+        with _geojson_cache_lock:
+            if _geojson_cache is None:
+                max_bytes = getattr(settings, 'GEOJSON_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+                _geojson_cache = GeoJSONBytesCache(max_bytes=max_bytes)
+    return _geojson_cache
+
+
+def bytes_response(request, variants, status=200):
+    """Picks the best encoding the client accepts and returns the cached bytes as-is"""
+    accepted = accepted_encodings(request)
+    for coding in ('br', 'gzip'):
+        if coding in variants and coding in accepted:
+            response = HttpResponse(variants[coding], content_type='application/json', status=status)
+            response['Content-Encoding'] = coding
+            break
+    else:
+        response = HttpResponse(variants['identity'], content_type='application/json', status=status)
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Length'] = str(len(response.content))
+    return response
+
+
+def geojson_response(request, data):
+    """
+    Serializes a one-off response (e.g. a viewport query) without caching it.
+    Only the encoding the client prefers is computed.
+    """
+    body = encode_geojson(data)
+    accepted = accepted_encodings(request)
+    variants = {'identity': body}
+    if brotli is not None and 'br' in accepted:
+        variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif 'gzip' in accepted:
+        variants['gzip'] = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return bytes_response(request, variants)
+
+
+def cached_geojson_response(request, layer_paths, params, build):
+    """
+    Serves a GeoJSON response from the byte cache.
+
+    layer_paths is the layer (or list of layers) the response is derived from;
+    their mtimes form the layer version, so edited data is re-serialized.
+    params holds the filter parameters that select the features; it must be
+    JSON-serializable. Returns None when build() has nothing to serve.
+    """
+    if isinstance(layer_paths, str):
+        layer_paths = [layer_paths]
+    version = tuple((path, layer_mtime(path)) for path in layer_paths)
+    key = (version, json.dumps(params, sort_keys=True, default=str))
+    variants = get_geojson_cache().get_or_build(key, build)
+    if variants is None:
+        return None
+    return bytes_response(request, variants)
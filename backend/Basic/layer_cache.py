@@ -0,0 +1,182 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+import geopandas as gpd
+import shapely
+from django.conf import settings
+
+from .layer_store import fresh_parquet_path, prepare_layer, repair_geometries
+from .layer_index import CodeIndex
+
+logger = logging.getLogger(__name__)
+
+# Sidecar files whose changes should invalidate a cached shapefile layer.
+# The .shx index is left out: it is derived from the .shp, and GDAL rewrites it on
+# every read while SHAPE_RESTORE_SHX=YES (set by mapplot), which would defeat the cache.
+SHAPEFILE_SIDECARS = ('.shp', '.dbf', '.prj', '.cpg')
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def layer_mtime(path):
+    """
+    Returns the latest modification time of a layer on disk.
+    For shapefiles the sidecar files are included, so editing the .dbf alone
+    is enough to invalidate the cached copy.
+    """
+    root, ext = os.path.splitext(path)
+    if ext.lower() != '.shp':
+        return os.path.getmtime(path)
+    mtimes = [os.path.getmtime(root + sidecar) for sidecar in SHAPEFILE_SIDECARS
+              if os.path.exists(root + sidecar)]
+    return max(mtimes) if mtimes else os.path.getmtime(path)
+
+
+def estimate_gdf_bytes(gdf):
+    """Approximate in-memory size of a GeoDataFrame, including geometry coordinates"""
+    attribute_bytes = int(gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum())
+    # Shapely geometries live outside the pandas buffers; count 16 bytes per xy pair
+    # plus a small fixed overhead per geometry object.
+    coordinate_count = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+    return attribute_bytes + coordinate_count * 16 + len(gdf) * 64
+
+
+def read_layer(path, repair=False, mtime=None):
+    """
+    Reads a layer from disk, reprojected to EPSG:4326 with normalized code columns.
+    A fresh GeoParquet copy written by `manage.py ingest_layers` (which holds the
+    same prepared layer) is preferred over the shapefile itself. If repair is
+    True, invalid geometries are fixed with buffer(0), whichever copy was read.
+    """
+    parquet_path = fresh_parquet_path(path, layer_mtime(path) if mtime is None else mtime)
+    if parquet_path:
+        gdf = gpd.read_parquet(parquet_path)
+    else:
+        gdf = prepare_layer(gpd.read_file(path))
+    if repair and repair_geometries(gdf):
+        logger.info(f"Invalid geometries found in {path}, fixed with buffer(0)")
+    return gdf
+
+
+class LayerCache:
+    """
+    Process-wide LRU cache of reprojected GeoDataFrames.
+
+    Entries are keyed by absolute path (plus the repair flag) and remember the
+    mtime they were loaded with; a newer file on disk is reloaded on the next
+    access. Cached frames are shared between requests and must not be mutated
+    by callers - filter or copy them instead.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_entry(self, path, repair=False):
+        path = os.path.abspath(path)
+        key = (path, repair)
+        mtime = layer_mtime(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['mtime'] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        gdf = read_layer(path, repair=repair, mtime=mtime)
+        nbytes = estimate_gdf_bytes(gdf)
+        logger.info(f"Loaded layer {path} ({len(gdf)} features, ~{nbytes} bytes)")
+
+        entry = {'mtime': mtime, 'gdf': gdf, 'nbytes': nbytes, 'derived': {}}
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old['nbytes']
+            self._entries[key] = entry
+            self.current_bytes += nbytes
+            self._evict()
+        return entry
+
+    def get(self, path, repair=False):
+        return self._get_entry(path, repair=repair)['gdf']
+
+    def get_derived(self, path, name, builder, repair=False):
+        """
+        Returns a structure derived from a cached layer (index, tree, ...),
+        building it with builder(gdf) the first time it is requested for the
+        currently loaded version of the layer. Derived structures are dropped
+        together with their layer. Returns (gdf, derived).
+        """
+        entry = self._get_entry(path, repair=repair)
+        derived = entry['derived'].get(name)
+        if derived is None:
+            derived = builder(entry['gdf'])
+            nbytes = getattr(derived, 'nbytes', 0)
+            with self._lock:
+                if name not in entry['derived']:
+                    entry['derived'][name] = derived
+                    entry['nbytes'] += nbytes
+                    if self._entries.get((os.path.abspath(path), repair)) is entry:
+                        self.current_bytes += nbytes
+                derived = entry['derived'][name]
+        return entry['gdf'], derived
+
+    def _evict(self):
+        # Always keep the most recently loaded layer, even if it alone exceeds the budget
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self.current_bytes -= entry['nbytes']
+            self.evictions += 1
+            logger.info(f"Evicted layer {key[0]} from layer cache")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'layers': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_layer_cache = None
+_layer_cache_lock = threading.Lock()
+
+
+def get_layer_cache():
+    global _layer_cache
+    if _layer_cache is None:
+        with _layer_cache_lock:
+            if _layer_cache is None:
+                max_bytes = getattr(settings, 'LAYER_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+                _layer_cache = LayerCache(max_bytes=max_bytes)
+    return _layer_cache
+
+
+def load_layer(path, repair=False):
+    """Returns the cached EPSG:4326 GeoDataFrame for path, loading it on a miss"""
+    return get_layer_cache().get(path, repair=repair)
+
+
+def load_layer_with_index(path, columns, repair=False):
+    """Returns (gdf, CodeIndex) for path; the index over columns is built once per layer version"""
+    columns = tuple(columns)
+    return get_layer_cache().get_derived(
+        path, ('code_index', columns), lambda gdf: CodeIndex(gdf, columns), repair=repair
+    )
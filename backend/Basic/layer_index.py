@@ -0,0 +1,70 @@
+import numpy as np
+
+
+def canonical_code(value):
+    """
+    Normalizes a census code so that '09', '9', 9 and 9.0 all compare equal.
+    Numeric codes become ints; anything else becomes a stripped, upper-cased string.
+    Returns None for empty values.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        return int(value) if float(value).is_integer() else float(value)
+    text = str(value).strip().upper()
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    return text
+
+
+class CodeIndex:
+    """
+    Hash index from canonical code (or a tuple of codes for composite keys)
+    to row positions of a layer. Built once per loaded layer version.
+    """
+
+    def __init__(self, gdf, columns):
+        self.columns = tuple(columns)
+        canonical = [gdf[column].map(canonical_code).tolist() for column in self.columns]
+        keys = canonical[0] if len(canonical) == 1 else list(zip(*canonical))
+
+        positions = {}
+        for position, key in enumerate(keys):
+            positions.setdefault(key, []).append(position)
+        self._positions = {key: np.asarray(rows, dtype=np.int64) for key, rows in positions.items()}
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def nbytes(self):
+        # Rough size: one dict slot plus the position array per key
+        return sum(rows.nbytes + 100 for rows in self._positions.values())
+
+    def make_key(self, *codes):
+        canonical = tuple(canonical_code(code) for code in codes)
+        return canonical[0] if len(canonical) == 1 else canonical
+
+    def lookup(self, keys):
+        """
+        Resolves canonical keys to row positions in request order.
+        Returns (positions, missing_keys).
+        """
+        found = []
+        missing = []
+        for key in keys:
+            rows = self._positions.get(key)
+            if rows is None:
+                missing.append(key)
+            else:
+                found.append(rows)
+        positions = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        return positions, missing
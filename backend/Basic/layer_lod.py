@@ -0,0 +1,81 @@
+import shapely
+
+from .layer_cache import get_layer_cache
+
+# Simplification tolerances in degrees (layers are cached in EPSG:4326).
+# Level 0 is the full-resolution geometry.
+LOD_TOLERANCES = [0.0, 0.0002, 0.001, 0.005, 0.02, 0.08]
+
+# Web map tiles are 256 px wide and cover 360 degrees at zoom 0
+TILE_SIZE = 256
+
+
+def tolerance_for_zoom(zoom):
+    """Degrees covered by one screen pixel at the given web map zoom level"""
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def level_for_tolerance(tolerance):
+    """Coarsest level whose tolerance does not exceed the requested one"""
+    level = 0
+    for index, level_tolerance in enumerate(LOD_TOLERANCES):
+        if level_tolerance <= tolerance:
+            level = index
+    return level
+
+
+def requested_lod_level(*param_sources):
+    """
+    Reads an optional `zoom` or `tolerance` parameter and returns the LOD level.
+    param_sources are dict-likes (request body, query string) searched in order.
+    Without either parameter the full-resolution level 0 is used.
+    Raises ValueError for values that are not numbers.
+    """
+    def first(name):
+        for params in param_sources:
+            value = params.get(name) if hasattr(params, 'get') else None
+            if value not in (None, ''):
+                return value
+        return None
+
+    tolerance = first('tolerance')
+    if tolerance is not None:
+        return level_for_tolerance(float(tolerance))
+    zoom = first('zoom')
+    if zoom is not None:
+        # Simplify below one pixel so the loss is not visible at that zoom
+        return level_for_tolerance(tolerance_for_zoom(float(zoom)))
+    return 0
+
+
+class LayerLOD:
+    """Geometries of a layer simplified at every LOD tolerance, aligned with its rows"""
+
+    def __init__(self, gdf):
+        geometry = gdf.geometry
+        self.levels = [geometry.values]
+        for tolerance in LOD_TOLERANCES[1:]:
+            # preserve_topology keeps every polygon valid and prevents rings from collapsing
+            self.levels.append(geometry.simplify(tolerance, preserve_topology=True).values)
+
+    @property
+    def nbytes(self):
+        coordinates = sum(int(shapely.get_num_coordinates(level).sum()) for level in self.levels[1:])
+        return coordinates * 16
+
+    def frame(self, gdf, level):
+        """Shallow copy of gdf with its geometry replaced by the given level"""
+        if level == 0:
+            return gdf
+        simplified = gdf.copy(deep=False)
+        simplified[gdf.geometry.name] = self.levels[level]
+        return simplified
+
+
+def load_layer_lod(path, level, repair=False):
+    """Returns the cached layer with geometries at the requested LOD level"""
+    if level == 0:
+        # Full resolution needs no simplified copies, so do not build them
+        return get_layer_cache().get(path, repair=repair)
+    gdf, lod = get_layer_cache().get_derived(path, 'lod', LayerLOD, repair=repair)
+    return lod.frame(gdf, level)
@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .layer_cache import get_layer_cache
+from .layer_lod import load_layer_lod
+
+WHERE_OPERATORS = {
+    '=': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+
+def parse_bbox(value):
+    """
+    Parses a bbox given as "minx,miny,maxx,maxy" or a list of four numbers (EPSG:4326).
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        raise ValueError("bbox must be minx,miny,maxx,maxy")
+    minx, miny, maxx, maxy = (float(v) for v in value)
+    if minx > maxx or miny > maxy:
+        raise ValueError("bbox min values must not exceed max values")
+    return minx, miny, maxx, maxy
+
+
+def parse_where(value):
+    """
+    Parses an attribute filter given as a JSON object (or its string form).
+    Each key is a column; its value is a scalar (equality), a list (membership)
+    or an object of operator -> value with operators =, !=, <, <=, >, >=.
+    All conditions must hold. Returns a list of (column, operator, value).
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError("where must be a JSON object")
+    if not isinstance(value, dict):
+        raise ValueError("where must be a JSON object")
+
+    conditions = []
+    for column, condition in value.items():
+        if isinstance(condition, list):
+            conditions.append((column, 'in', condition))
+        elif isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator not in WHERE_OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {operator}")
+                conditions.append((column, operator, operand))
+        else:
+            conditions.append((column, '=', condition))
+    return conditions
+
+
+def requested_feature_filter(*param_sources):
+    """
+    Reads optional `bbox` and `where` parameters from dict-likes searched in order.
+    Returns (bbox, where), either of which may be None. Raises ValueError on bad input.
+    """
+    def first(name):
+        for params in param_sources:
+            value = params.get(name) if hasattr(params, 'get') else None
+            if value not in (None, ''):
+                return value
+        return None
+
+    bbox = first('bbox')
+    where = first('where')
+    return (
+        parse_bbox(bbox) if bbox is not None else None,
+        parse_where(where) if where is not None else None,
+    )
+
+
+class LayerQueryIndex:
+    """
+    STRtree over a layer's EPSG:4326 geometries plus columnar attribute arrays,
+    built once per loaded layer version to answer bbox/where queries.
+    """
+
+    def __init__(self, gdf):
+        self.tree = shapely.STRtree(gdf.geometry.values)
+        self.row_count = len(gdf)
+        self._frame = gdf.drop(columns=gdf.geometry.name)
+        self._columns = {}
+
+    @property
+    def nbytes(self):
+        # STRtree nodes are small compared to the geometries they point at
+        return self.row_count * 64
+
+    def column(self, name):
+        if name not in self._columns:
+            if name not in self._frame.columns:
+                raise ValueError(f"Unknown column in where: {name}")
+            self._columns[name] = self._frame[name].to_numpy()
+        return self._columns[name]
+
+    def _condition_mask(self, values, operator, operand):
+        numeric = pd.api.types.is_numeric_dtype(values.dtype)
+
+        def coerce(item):
+            if numeric:
+                try:
+                    return float(item)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Column needs a numeric value, got {item!r}")
+            return str(item)
+
+        if not numeric:
+            values = values.astype(str)
+        if operator == 'in':
+            return np.isin(values, [coerce(item) for item in operand])
+        return WHERE_OPERATORS[operator](values, coerce(operand))
+
+    def select(self, bbox=None, where=None):
+        """Row positions (in layer order) intersecting bbox and matching all where conditions"""
+        if bbox is not None:
+            positions = self.tree.query(shapely.box(*bbox), predicate='intersects')
+            positions.sort()
+        else:
+            positions = np.arange(self.row_count)
+
+        for column, operator, operand in where or []:
+            values = self.column(column)[positions]
+            positions = positions[self._condition_mask(values, operator, operand)]
+        return positions
+
+
+def load_layer_query(path, repair=False):
+    """Returns (gdf, LayerQueryIndex) for the cached layer at path"""
+    return get_layer_cache().get_derived(path, 'query_index', LayerQueryIndex, repair=repair)
+
+
+def select_features(path, bbox=None, where=None, level=0, repair=False):
+    """
+    Rows of the cached layer matching bbox/where, in layer order, with geometries
+    at the requested LOD level. Raises ValueError for unknown where columns.
+    """
+    _, index = load_layer_query(path, repair=repair)
+    positions = index.select(bbox, where)
+    return load_layer_lod(path, level, repair=repair).take(positions)
@@ -0,0 +1,104 @@
+import os
+import logging
+
+import geopandas as gpd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Media trees converted by `python manage.py ingest_layers`
+LAYER_TREES = ['basic_shape', 'Drain_shp', 'gwa_data', 'shapefile']
+
+# Code columns used for lookups by the Basic, Drain and gwa endpoints
+CODE_COLUMNS = ['state_code', 'STATE_CODE', 'DISTRICT_C', 'SUBDIS_COD', 'shapeID',
+                'River_Code', 'Stretch_ID', 'Drain_No']
+
+POLYGON_TYPES = ('Polygon', 'MultiPolygon')
+
+# Part of every copy's file name, bumped whenever the stored content changes so
+# copies written by an older ingest are ignored instead of served as fresh
+# (2: geometries are no longer repaired at ingest)
+STORE_FORMAT = 2
+
+
+def get_store_root():
+    return getattr(settings, 'LAYER_STORE_ROOT', os.path.join(settings.MEDIA_ROOT, 'layer_store'))
+
+
+def parquet_path_for(path):
+    """
+    Returns the GeoParquet path mirroring a shapefile under MEDIA_ROOT,
+    or None when the shapefile lives outside MEDIA_ROOT.
+    """
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    path = os.path.abspath(path)
+    if os.path.commonpath([media_root, path]) != media_root:
+        return None
+    relative = os.path.relpath(path, media_root)
+    return os.path.join(get_store_root(), os.path.splitext(relative)[0] + f'.v{STORE_FORMAT}.parquet')
+
+
+def fresh_parquet_path(path, source_mtime):
+    """Returns the GeoParquet copy of path if it exists and is at least as new as the source"""
+    parquet_path = parquet_path_for(path)
+    if parquet_path and os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= source_mtime:
+        return parquet_path
+    return None
+
+
+def repair_geometries(gdf):
+    """Applies the buffer(0) fix to invalid polygon geometries; lines and points are left alone"""
+    invalid = ~gdf.geometry.is_valid & gdf.geometry.geom_type.isin(POLYGON_TYPES)
+    if invalid.any():
+        gdf.loc[invalid, gdf.geometry.name] = gdf.geometry[invalid].buffer(0)
+    return int(invalid.sum())
+
+
+def normalize_code_columns(gdf):
+    """Strips whitespace from text code columns so lookups do not depend on shapefile padding quirks"""
+    for column in CODE_COLUMNS:
+        if column in gdf.columns and gdf[column].dtype == object:
+            gdf[column] = gdf[column].map(lambda v: v.strip() if isinstance(v, str) else v)
+
+
+def prepare_layer(gdf):
+    """
+    A shapefile as every loader serves it: reprojected to EPSG:4326 with code columns
+    normalized. The GeoParquet copy stores exactly this, so a layer reads the same
+    with or without it; geometry repair is left to the loaders that ask for it.
+    """
+    if gdf.crs and gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs("EPSG:4326")
+    normalize_code_columns(gdf)
+    return gdf
+
+
+def convert_layer(path):
+    """
+    Converts one shapefile into its GeoParquet copy (see prepare_layer).
+    Returns (parquet_path, feature_count).
+    """
+    parquet_path = parquet_path_for(path)
+    if parquet_path is None:
+        raise ValueError(f"{path} is not inside MEDIA_ROOT")
+
+    gdf = prepare_layer(gpd.read_file(path))
+
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    # Write to a temporary file first so readers never see a half-written layer
+    tmp_path = parquet_path + '.tmp'
+    gdf.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    logger.info(f"Converted {path} -> {parquet_path} ({len(gdf)} features)")
+    return parquet_path, len(gdf)
+
+
+def find_layers(trees=None):
+    """Yields every shapefile under the given media trees"""
+    for tree in trees or LAYER_TREES:
+        tree_root = os.path.join(settings.MEDIA_ROOT, tree)
+        for dirpath, dirnames, filenames in os.walk(tree_root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith('.shp'):
+                    yield os.path.join(dirpath, filename)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from Basic.backtest import load_backtest, write_backtest
+from Basic.projection import PROJECTION_METHODS, load_growth_parameters
+
+
+class Command(BaseCommand):
+    help = (
+        "Fits every time series method on the 1951-2001 census of each subdistrict in "
+        "Population_2011, scores it against the 2011 census and stores the best method "
+        "and its error per subdistrict next to the GeoParquet layer store. "
+        "Time_series best_fit=true reads the stored table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rewrite the table even if it was fitted on the current Population_2011.",
+        )
+        parser.add_argument(
+            '--output',
+            help="Also write the per-subdistrict results to this CSV file.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        parameters = load_growth_parameters()
+        backtest = None if options['force'] else load_backtest(parameters)
+        if backtest is None:
+            backtest, path = write_backtest(parameters)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f"Backtested {len(backtest)} subdistricts in {elapsed:.2f}s, wrote {path}"))
+        else:
+            self.stdout.write(f"Stored backtest of {len(backtest)} subdistricts is up to date")
+
+        for method in PROJECTION_METHODS:
+            errors = backtest.error_pct[method]
+            best = int((backtest.best_method == method).sum())
+            median = np.nanmedian(errors) if np.isfinite(errors).any() else float('nan')
+            self.stdout.write(f"  {method:<12} best for {best:>6} subdistricts, median error {median:.2f}%")
+
+        if options['output']:
+            pd.DataFrame(backtest.rows()).to_csv(options['output'], index=False)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Basic.catchment_membership import (
+    catchment_layer_path, village_layer_path, load_membership, membership_path, write_membership,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes which villages intersect each drain catchment, with the overlap area "
+        "and the share of the village area inside the catchment. Catchment endpoints look "
+        "pairs up in this table instead of intersecting the layers on every request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rebuild the table even if it is newer than both layers.",
+        )
+
+    def handle(self, *args, **options):
+        for path in (catchment_layer_path(), village_layer_path()):
+            if not os.path.exists(path):
+                raise CommandError(f"Layer not found: {path}")
+
+        if not options['force'] and load_membership() is not None:
+            self.stdout.write(f"{membership_path()} is up to date")
+            return
+
+        started = time.perf_counter()
+        path, pairs = write_membership()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {pairs} catchment/village pairs to {path} in {time.perf_counter() - started:.2f}s"
+        ))
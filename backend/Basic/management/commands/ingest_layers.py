@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Basic.layer_cache import layer_mtime
+from Basic.layer_store import LAYER_TREES, convert_layer, find_layers, fresh_parquet_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the media shapefile trees into GeoParquet (EPSG:4326, normalized code columns). "
+        "Layer loaders prefer a fresh Parquet copy over the shapefile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tree', action='append', choices=LAYER_TREES,
+            help="Media tree to convert (repeatable). Defaults to all trees.",
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Rewrite Parquet copies even if they are newer than the shapefile.",
+        )
+
+    def handle(self, *args, **options):
+        converted = skipped = failed = 0
+        for path in find_layers(options['tree']):
+            if not options['force'] and fresh_parquet_path(path, layer_mtime(path)):
+                skipped += 1
+                continue
+            started = time.perf_counter()
+            try:
+                parquet_path, features = convert_layer(path)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Failed to convert {path}: {e}")
+                continue
+            converted += 1
+            size_ratio = os.path.getsize(parquet_path) / max(os.path.getsize(path), 1)
+            self.stdout.write(
+                f"{path}: {features} features, "
+                f"{time.perf_counter() - started:.2f}s, parquet/shp size {size_ratio:.2f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} layers, {skipped} already fresh, {failed} failed"
+        ))
+        if failed:
+            raise CommandError(f"{failed} layers could not be converted")
@@ -0,0 +1,464 @@
+import itertools
+import math
+import threading
+import logging
+
+import numpy as np
+
+from .models import Population_2011
+
+PROJECTION_METHODS = ('Arithmetic', 'Geometric', 'Incremental', 'Exponential', 'Logistic')
+DEMOGRAPHIC = 'Demographic'
+BATCH_METHODS = PROJECTION_METHODS + (DEMOGRAPHIC,)
+
+# Census columns of Population_2011, oldest first
+HISTORY_FIELDS = ['population_1951', 'population_1961', 'population_1971', 'population_1981',
+                  'population_1991', 'population_2001', 'population_2011']
+HISTORY_YEARS = [1951, 1961, 1971, 1981, 1991, 2001, 2011]
+
+
+logger = logging.getLogger(__name__)
+
+# Every computed parameter table gets a new version, so memoized projections
+# made from older parameters are never reused
+_parameter_versions = itertools.count(1)
+
+
+def _sequential_sum(columns):
+    """Adds the columns of a 2-D array left to right, so rounding matches a plain Python sum"""
+    total = columns[:, 0]
+    for j in range(1, columns.shape[1]):
+        total = total + columns[:, j]
+    return total
+
+
+def _log10_row(row):
+    # Same call as the original per-row code; non-positive populations have no log fit
+    if min(row) <= 0:
+        return [math.nan] * len(row)
+    return [math.log(p, 10) for p in row]
+
+
+class GrowthParameters:
+    """
+    Per-subdistrict parameters of the time series methods, computed from the
+    decadal census history (1951-2011 unless other census years are given) in
+    one pass. Projections start from the last census year. Arithmetic in every
+    step follows the per-row formulas in service.py, so projections truncate to
+    the same ints.
+    """
+
+    def __init__(self, codes, history, years=HISTORY_YEARS):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.version = next(_parameter_versions)
+        self.years = list(years)
+        decades = len(self.years) - 1
+        history = np.asarray(history, dtype=np.int64).reshape(len(self.codes), len(self.years))
+        self.history = history
+        self._positions = {code: i for i, code in enumerate(self.codes.tolist())}
+
+        p1 = history[:, 0]
+        p7 = history[:, -1]
+        self.total_p7 = p7
+
+        # Arithmetic: whole-number annual increase from the mean decadal increase
+        self.arithmetic_rate = np.floor(((p7 - p1) / decades) / 10)
+
+        # Geometric: geometric mean of the positive decadal growth percentages
+        diffs = history[:, 1:] - history[:, :-1]
+        previous = history[:, :-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(previous != 0, (diffs * 100) / previous, 0.0)
+        valid = growth > 0
+        product = np.ones(len(self.codes))
+        for j in range(growth.shape[1]):
+            product = np.where(valid[:, j], product * growth[:, j], product)
+        counts = valid.sum(axis=1)
+        self.geometric_rate = np.array([
+            round(math.pow(value, 1 / count), 4) if count else 0.0
+            for value, count in zip(product.tolist(), counts.tolist())
+        ])
+
+        # Incremental: mean decadal increase and mean change of that increase
+        self.d_mean = diffs.sum(axis=1) / decades
+        self.m_mean = (diffs[:, 1:] - diffs[:, :-1]).sum(axis=1) / (decades - 1)
+
+        # Exponential: least-squares slope of log10(population) against years since the last census
+        x = np.array(self.years) - self.years[-1]
+        y = np.array([_log10_row(row) for row in history.tolist()]).reshape(history.shape)
+        n = len(self.years)
+        x_i_sum = int(x.sum())
+        x_i_square_sum = int((x ** 2).sum())
+        y_i_sum = _sequential_sum(y)
+        x_y_prod_sum = _sequential_sum(x * y)
+        self.exponential_rate = ((n * x_y_prod_sum) - (x_i_sum * y_i_sum)) / (n * x_i_square_sum - (x_i_sum ** 2))
+
+        self._fit_logistic(history, x)
+
+        # Subdistricts each method can project; the others would divide by zero or take log(0)
+        self.usable = {
+            'Arithmetic': p7 != 0,
+            'Geometric': np.ones(len(self.codes), dtype=bool),
+            'Incremental': p7 != 0,
+            'Exponential': ~np.isnan(self.exponential_rate),
+            # Subdistricts without a logistic fit fall back to the geometric curve
+            'Logistic': np.ones(len(self.codes), dtype=bool),
+        }
+
+    def _fit_logistic(self, history, x):
+        """
+        Logistic curve P(t) = Ps / (1 + m * e^(r * t)), t in years since the last
+        census, for every subdistrict: the saturation population Ps from the
+        three-point formula over the last three equally spaced censuses (1951, 1981
+        and 2011 for the full history), then ln(m) and r by least squares of
+        ln(Ps / P - 1) against t over all censuses. The fit is degenerate
+        (logistic_fitted is False) when a population is not positive, the three
+        points do not bend towards a saturation above every census, or the
+        fitted curve is not growing.
+        """
+        history = history.astype(np.float64)
+        last = history.shape[1] - 1
+        spacing = last // 2
+        p0, p1, p2 = (history[:, i] for i in (last - 2 * spacing, last - spacing, last))
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            saturation = (2 * p0 * p1 * p2 - p1 ** 2 * (p0 + p2)) / (p0 * p2 - p1 ** 2)
+            fitted = (history.min(axis=1) > 0) & np.isfinite(saturation) & (saturation > history.max(axis=1))
+            y = np.log(np.where(fitted[:, None], saturation[:, None] / history - 1, 1.0))
+            x_mean = x.mean()
+            rate = ((x - x_mean) * (y - y.mean(axis=1)[:, None])).sum(axis=1) / ((x - x_mean) ** 2).sum()
+            offset = y.mean(axis=1) - rate * x_mean
+        fitted &= np.isfinite(rate) & np.isfinite(offset) & (rate < 0)
+
+        self.logistic_fitted = fitted
+        self.logistic_saturation = np.where(fitted, saturation, np.nan)
+        self.logistic_rate = np.where(fitted, rate, np.nan)
+        self.logistic_offset = np.where(fitted, offset, np.nan)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def positions(self, subdistrict_codes):
+        """Row of each subdistrict code, or -1 when it has no census history"""
+        return np.array([self._positions.get(code, -1) for code in subdistrict_codes], dtype=np.int64)
+
+
+def load_growth_parameters(subdistrict_codes=None):
+    """
+    GrowthParameters from a single Population_2011 query, for the given
+    subdistricts or for all of them
+    """
+    queryset = Population_2011.objects.all()
+    if subdistrict_codes is not None:
+        queryset = queryset.filter(subdistrict_code__in=list(subdistrict_codes))
+    rows = list(queryset.values_list('subdistrict_code', *HISTORY_FIELDS))
+    return GrowthParameters([row[0] for row in rows], [row[1:] for row in rows])
+
+
+_growth_parameters = None
+_growth_parameters_lock = threading.Lock()
+
+
+def get_growth_parameters():
+    """
+    GrowthParameters of every subdistrict, computed on first use and kept in
+    memory until Population_2011 changes (see signals.py), so projection
+    requests do not query the census history.
+    """
+    global _growth_parameters
+    parameters = _growth_parameters
+    if parameters is None:
+        with _growth_parameters_lock:
+            if _growth_parameters is None:
+                _growth_parameters = load_growth_parameters()
+                logger.info(f"Computed growth parameters for {len(_growth_parameters)} subdistricts")
+            parameters = _growth_parameters
+    return parameters
+
+
+def invalidate_growth_parameters():
+    """Drops the cached parameters; the next projection recomputes them"""
+    global _growth_parameters
+    with _growth_parameters_lock:
+        _growth_parameters = None
+
+
+def requested_subdistrict_codes(subdistrict):
+    """Integer codes of the subdistrict_props sent by the frontend ([{'id': ...}, ...])"""
+    codes = set()
+    for x in subdistrict:
+        try:
+            codes.add(int(x['id']))
+        except (TypeError, ValueError):
+            continue
+    return codes
+
+
+class VillageArrays:
+    """Villages of a projection request as aligned arrays"""
+
+    def __init__(self, villages):
+        self.ids = [village['id'] for village in villages]
+        self.population = np.asarray([village['population'] for village in villages])
+        self.subdistrict_codes = [village['subDistrictId'] for village in villages]
+
+    @classmethod
+    def from_columns(cls, ids, population, subdistrict_codes):
+        """VillageArrays from columns that are already split out (e.g. a registered selection)"""
+        arrays = cls.__new__(cls)
+        arrays.ids = list(ids)
+        arrays.population = np.asarray(population)
+        arrays.subdistrict_codes = list(subdistrict_codes)
+        return arrays
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def as_village_arrays(villages):
+    """VillageArrays of a villages_props list, or villages itself when it already is one"""
+    return villages if isinstance(villages, VillageArrays) else VillageArrays(villages)
+
+
+def _factor_table(function, rates, exponents):
+    """function(rate, exponent) for every subdistrict rate and year, with math-module rounding"""
+    return np.array([[function(rate, exponent) for exponent in exponents] for rate in rates.tolist()]).reshape(
+        len(rates), len(exponents)
+    )
+
+
+def included_villages(method, villages, parameters, subdistricts=None):
+    """
+    (included, positions): mask of the villages whose subdistrict has usable
+    parameters for method (optionally only those subdistrict codes), and the
+    parameter row of each included village.
+    """
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"Unknown projection method: {method}")
+    positions = parameters.positions(villages.subdistrict_codes)
+    included = positions >= 0
+    included[included] = parameters.usable[method][positions[included]]
+    if subdistricts is not None:
+        subdistricts = set(subdistricts)
+        included &= np.array([code in subdistricts for code in villages.subdistrict_codes], dtype=bool)
+    return included, positions[included]
+
+
+def _project(method, value, positions, t, parameters):
+    """
+    Untruncated projections (rows x years) of the populations in value (a column)
+    whose parameter rows are positions; t holds the years since the base year.
+    """
+    if method == 'Arithmetic':
+        rate = parameters.arithmetic_rate[positions][:, None]
+        share = value / parameters.total_p7[positions][:, None]
+        return value + ((rate * t) * share)
+    if method == 'Incremental':
+        k = value / parameters.total_p7[positions][:, None]
+        n = t / 10
+        d_mean = parameters.d_mean[positions][:, None]
+        m_mean = parameters.m_mean[positions][:, None]
+        return value + k * n * d_mean + ((n * (n + 1)) * m_mean / 2) * k
+
+    # The growth factor only depends on subdistrict and year, so it is computed per pair
+    used, inverse = np.unique(positions, return_inverse=True)
+    if method == 'Geometric':
+        factors = _factor_table(
+            lambda rate, n: math.pow(1 + (rate / 100), n), parameters.geometric_rate[used], (t[0] / 10).tolist()
+        )
+    elif method == 'Logistic':
+        factors = _logistic_factors(parameters, used, t[0].tolist())
+    else:
+        factors = _factor_table(
+            lambda rate, years_since: math.exp(rate * years_since), parameters.exponential_rate[used], t[0].tolist()
+        )
+    return value * factors[inverse]
+
+
+def _logistic_factors(parameters, used, years_since):
+    """
+    P(t) / P(0) of the fitted logistic curve = (1 + m) / (1 + m * e^(r * t)) for the
+    used parameter rows, and the geometric factor for rows without a logistic fit
+    """
+    factors = np.empty((len(used), len(years_since)))
+    for i, row in enumerate(used.tolist()):
+        if parameters.logistic_fitted[row]:
+            m = math.exp(parameters.logistic_offset[row])
+            rate = parameters.logistic_rate[row]
+            factors[i] = [(1 + m) / (1 + m * math.exp(rate * t)) for t in years_since]
+        else:
+            growth = 1 + parameters.geometric_rate[row] / 100
+            factors[i] = [math.pow(growth, t / 10) for t in years_since]
+    return factors
+
+
+def _years_since(base_year, years):
+    return (np.asarray([int(year) for year in years], dtype=np.int64) - int(base_year))[None, :]
+
+
+def project_villages(method, base_year, years, villages, parameters, subdistricts=None, memo=None):
+    """
+    Projects every village to every year with one of PROJECTION_METHODS.
+    subdistricts optionally restricts the projection to villages of those subdistrict codes.
+    memo (a ProjectionMemo) reuses the rows of villages projected by earlier requests
+    and only computes the others.
+
+    Returns (included, matrix): a mask of the villages whose subdistrict has
+    usable parameters, and an int64 matrix (included villages x years)
+    truncated towards zero like int() in the per-village formulas.
+    """
+    included, positions = included_villages(method, villages, parameters, subdistricts)
+    value = villages.population[included][:, None]
+    t = _years_since(base_year, years)
+    if memo is None or not memo.covers(t):
+        projected = _project(method, value, positions, t, parameters)
+        return included, np.trunc(projected).astype(np.int64)
+
+    # Rows are cached over the whole memo horizon and the requested years picked from them
+    partition = (method, parameters.version, int(base_year))
+    codes = memo.village_codes(villages.ids)[included]
+    population = value[:, 0].astype(np.float64)
+    found, cached = memo.lookup(partition, codes, positions, population, t[0])
+    matrix = np.empty((len(codes), t.shape[1]), dtype=np.int64)
+    matrix[found] = cached
+    missing = ~found
+    if missing.any():
+        horizon = np.arange(memo.horizon + 1, dtype=np.int64)[None, :]
+        computed = np.trunc(_project(method, value[missing], positions[missing], horizon, parameters)).astype(np.int64)
+        memo.store(partition, codes[missing], positions[missing], population[missing], computed)
+        matrix[missing] = computed[:, t[0]]
+    return included, matrix
+
+
+def project_subdistricts(method, base_year, years, villages, parameters, subdistricts=None):
+    """
+    Aggregated fast path: every method is linear in the village population, so
+    the villages of a subdistrict are summed first and projected as one row
+    (subdistricts x years instead of villages x years).
+
+    Returns (included, totals) with float per-year totals. They skip the
+    per-village int() truncation, so they can exceed the exact totals by up
+    to one person per village.
+    """
+    included, positions = included_villages(method, villages, parameters, subdistricts)
+    used, inverse = np.unique(positions, return_inverse=True)
+    summed = np.bincount(inverse, weights=villages.population[included], minlength=len(used))
+    projected = _project(method, summed[:, None], used, _years_since(base_year, years), parameters)
+    return included, projected.sum(axis=0)
+
+
+def project_demographic(base_year, years, villages, birth_rate, death_rate, emigration_rate, immigration_rate):
+    """Demographic method for every village and year; rates are annual fractions"""
+    t = _years_since(base_year, years)
+    value = villages.population[:, None]
+    projected = value + (value * t * (birth_rate - death_rate)) + (t * (emigration_rate - immigration_rate))
+    return np.trunc(projected).astype(np.int64)
+
+
+def aggregate_demographic(base_year, years, villages, birth_rate, death_rate, emigration_rate, immigration_rate):
+    """
+    Aggregated fast path of project_demographic: per-year float totals from the
+    summed population and the village count, without per-village truncation.
+    """
+    t = _years_since(base_year, years)[0]
+    population = float(villages.population.sum())
+    return population + (population * t * (birth_rate - death_rate)) + len(villages) * (t * (emigration_rate - immigration_rate))
+
+
+def method_year_totals(method, base_year, years, villages, parameters, subdistricts=None, exact=True, memo=None):
+    """
+    (base_population, year_totals) of one time series method: the census population
+    of the included villages and the per-year totals, int64 when exact and float
+    on the aggregated fast path (exact=False, memo unused).
+    """
+    if exact:
+        included, matrix = project_villages(method, base_year, years, villages, parameters, subdistricts, memo)
+        return villages.population[included].sum(), matrix.sum(axis=0)
+    included, year_totals = project_subdistricts(method, base_year, years, villages, parameters, subdistricts)
+    return villages.population[included].sum(), year_totals
+
+
+def demographic_year_totals(base_year, years, villages, rates, exact=True):
+    """(base_population, year_totals) of the Demographic method, as method_year_totals"""
+    if exact:
+        return villages.population.sum(), project_demographic(base_year, years, villages, *rates).sum(axis=0)
+    return villages.population.sum(), aggregate_demographic(base_year, years, villages, *rates)
+
+
+def format_totals(base_population, years, year_totals):
+    """{"2011": base, year: total, ...} from method_year_totals, float totals rounded to whole people"""
+    if year_totals.dtype.kind == 'f':
+        year_totals = [int(round(total)) for total in year_totals.tolist()]
+    else:
+        year_totals = year_totals.tolist()
+    totals = {"2011": int(base_population)}
+    for year, total in zip(years, year_totals):
+        totals[int(year)] = total
+    return totals
+
+
+def method_totals(method, base_year, years, villages, parameters, subdistricts=None, exact=True, memo=None):
+    """
+    Totals over the villages of a request for one time series method.
+    exact=False takes the aggregated subdistrict-level fast path; memo is only used by the exact path.
+    """
+    base_population, year_totals = method_year_totals(
+        method, base_year, years, villages, parameters, subdistricts, exact, memo
+    )
+    return format_totals(base_population, years, year_totals)
+
+
+def batch_projection(base_year, villages, parameters, scenarios, subdistricts=None, exact=True, memo=None):
+    """
+    Projects several scenarios over one village selection.
+
+    Each scenario is {'years': [...], 'methods': [...], 'rates': (birth, death,
+    emigration, immigration) or None}. Every time series method is projected once
+    over the union of the scenarios' years; Demographic once per distinct rate set.
+
+    Returns {'years', 'methods', 'base_population', 'totals'} where
+    totals[scenario][method][year] follows the years and methods lists and is
+    None for years or methods a scenario did not ask for.
+    """
+    years = sorted({year for scenario in scenarios for year in scenario['years']})
+    methods = [method for method in BATCH_METHODS if any(method in scenario['methods'] for scenario in scenarios)]
+    year_index = {year: i for i, year in enumerate(years)}
+
+    base_population = {}
+    method_totals_by_year = {}
+    for method in methods:
+        if method == DEMOGRAPHIC:
+            base_population[method] = villages.population.sum().item()
+            continue
+        if exact:
+            included, matrix = project_villages(method, base_year, years, villages, parameters, subdistricts, memo)
+            year_totals = matrix.sum(axis=0).tolist()
+        else:
+            included, sums = project_subdistricts(method, base_year, years, villages, parameters, subdistricts)
+            year_totals = [int(round(total)) for total in sums.tolist()]
+        base_population[method] = villages.population[included].sum().item()
+        method_totals_by_year[method] = year_totals
+
+    demographic_totals = {}
+    totals = []
+    for scenario in scenarios:
+        rows = []
+        for method in methods:
+            if method not in scenario['methods']:
+                rows.append(None)
+                continue
+            if method == DEMOGRAPHIC:
+                rates = tuple(scenario['rates'])
+                if rates not in demographic_totals:
+                    if exact:
+                        year_totals = project_demographic(base_year, years, villages, *rates).sum(axis=0).tolist()
+                    else:
+                        year_totals = [int(round(total)) for total in aggregate_demographic(base_year, years, villages, *rates).tolist()]
+                    demographic_totals[rates] = year_totals
+                year_totals = demographic_totals[rates]
+            else:
+                year_totals = method_totals_by_year[method]
+            wanted = set(scenario['years'])
+            rows.append([year_totals[year_index[year]] if year in wanted else None for year in years])
+        totals.append(rows)
+
+    return {'years': years, 'methods': methods, 'base_population': base_population, 'totals': totals}
@@ -0,0 +1,122 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from .projection import DEMOGRAPHIC, VillageArrays, project_demographic, project_villages
+from .villages import village_codes
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; NDJSON and CSV exports do not need it
+    pa = None
+
+# Villages projected per step; memory stays bounded by this however large the selection is
+EXPORT_CHUNK_VILLAGES = 5000
+
+EXPORT_COLUMNS = ['village_code', 'subdistrict', 'method', 'year', 'value']
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def export_formats():
+    """Formats available in this environment (Parquet needs pyarrow)"""
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pa is not None]
+
+
+def projection_frames(base_year, years, villages, parameters, methods, subdistricts=None, rates=None,
+                      chunk_size=EXPORT_CHUNK_VILLAGES):
+    """
+    Yields the per-village projections as long DataFrames (EXPORT_COLUMNS), one per
+    chunk of villages and method. Villages a time series method cannot project
+    (no usable census history, or outside subdistricts) have no rows for it.
+    """
+    years = [int(year) for year in years]
+    codes = village_codes(villages.ids)
+    subdistrict_codes = np.asarray(villages.subdistrict_codes, dtype=np.int64)
+    for start in range(0, len(villages), chunk_size):
+        stop = start + chunk_size
+        chunk = VillageArrays.from_columns(
+            villages.ids[start:stop], villages.population[start:stop], villages.subdistrict_codes[start:stop]
+        )
+        for method in methods:
+            if method == DEMOGRAPHIC:
+                included = np.ones(len(chunk), dtype=bool)
+                matrix = project_demographic(base_year, years, chunk, *rates)
+            else:
+                included, matrix = project_villages(method, base_year, years, chunk, parameters, subdistricts)
+            if not len(matrix):
+                continue
+            yield pd.DataFrame({
+                'village_code': np.repeat(codes[start:stop][included], len(years)),
+                'subdistrict': np.repeat(subdistrict_codes[start:stop][included], len(years)),
+                'method': method,
+                'year': np.tile(np.asarray(years, dtype=np.int64), len(matrix)),
+                'value': matrix.ravel(),
+            }, columns=EXPORT_COLUMNS)
+
+
+def stream_ndjson(frames):
+    for frame in frames:
+        yield frame.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+
+
+def stream_csv(frames):
+    yield ','.join(EXPORT_COLUMNS) + '\n'
+    for frame in frames:
+        yield frame.to_csv(header=False, index=False)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written so far; tell() keeps counting for the Parquet footer"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_parquet(frames):
+    """One row group per frame, each sent as soon as it is written"""
+    schema = pa.schema([
+        ('village_code', pa.int64()), ('subdistrict', pa.int64()), ('method', pa.string()),
+        ('year', pa.int64()), ('value', pa.int64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def stream_export(export_format, frames):
+    """Byte/str chunks of the export in one of EXPORT_FORMATS"""
+    if export_format == 'ndjson':
+        return stream_ndjson(frames)
+    if export_format == 'csv':
+        return stream_csv(frames)
+    return stream_parquet(frames)
@@ -0,0 +1,200 @@
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .villages import village_codes
+
+# Disabled unless PROJECTION_MEMO_MAX_BYTES is set: the closed-form methods are
+# vectorized, so a cached row costs about as much to gather as to recompute.
+# It pays off for long horizons and repeated edits of large selections.
+DEFAULT_MAX_BYTES = 0
+
+# Rows cover the years base_year .. base_year + horizon, so requests for any
+# range inside it share the same cached villages
+DEFAULT_HORIZON = 90
+
+
+class _Slab:
+    """
+    Cached rows of one (method, parameter version, base year). Rows live in an
+    append-only buffer; the per-village metadata is kept sorted by village code
+    and points at its row through slots, so storing a few villages does not copy
+    the rows already cached.
+    """
+
+    def __init__(self, width):
+        self.codes = np.empty(0, dtype=np.int64)
+        self.slots = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.int64)
+        self.population = np.empty(0, dtype=np.float64)
+        self.used = np.empty(0, dtype=np.int64)
+        self.buffer = np.empty((0, width), dtype=np.int64)
+        self.filled = 0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def find(self, codes, positions, population):
+        """Index of each village, or -1 when it is not cached with the same subdistrict and population"""
+        if not len(self.codes):
+            return np.full(len(codes), -1, dtype=np.int64)
+        index = np.searchsorted(self.codes, codes).clip(max=len(self.codes) - 1)
+        found = (
+            (self.codes[index] == codes)
+            & (self.positions[index] == positions)
+            & (self.population[index] == population)
+            & (codes >= 0)
+        )
+        return np.where(found, index, -1)
+
+    def rows(self, index, columns):
+        return self.buffer[self.slots[index][:, None], columns[None, :]]
+
+    def _allocate(self, count):
+        if self.filled + count > len(self.buffer):
+            # Rows no longer referenced (replaced or evicted) are dropped when the buffer grows
+            live = self.buffer[self.slots]
+            capacity = max(2 * len(live), len(live) + count, 1024)
+            self.buffer = np.empty((capacity, self.buffer.shape[1]), dtype=np.int64)
+            self.buffer[:len(live)] = live
+            self.slots = np.arange(len(live), dtype=np.int64)
+            self.filled = len(live)
+        slots = np.arange(self.filled, self.filled + count, dtype=np.int64)
+        self.filled += count
+        return slots
+
+    def keep(self, mask):
+        self.codes = self.codes[mask]
+        self.slots = self.slots[mask]
+        self.positions = self.positions[mask]
+        self.population = self.population[mask]
+        self.used = self.used[mask]
+
+    def merge(self, codes, positions, population, used, rows):
+        # Entries stored again (e.g. with a new population) replace the old metadata
+        self.keep(~np.isin(self.codes, codes))
+        slots = self._allocate(len(codes))
+        self.buffer[slots] = rows
+        order = np.argsort(np.concatenate([self.codes, codes]), kind='stable')
+        self.codes = np.concatenate([self.codes, codes])[order]
+        self.slots = np.concatenate([self.slots, slots])[order]
+        self.positions = np.concatenate([self.positions, positions])[order]
+        self.population = np.concatenate([self.population, population])[order]
+        self.used = np.concatenate([self.used, np.full(len(codes), used, dtype=np.int64)])[order]
+
+
+class ProjectionMemo:
+    """
+    Memory-capped cache of per-village projection rows (int64, one value per
+    year of the horizon), keyed by (method, parameter version, base year) and by
+    village code. A row is reused only for the same subdistrict parameters and
+    population as sent in the request, so a selection that overlaps an earlier
+    one only projects the villages not seen before. Lookups are binary searches
+    over sorted arrays; the least recently requested villages are evicted first.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, horizon=DEFAULT_HORIZON):
+        self.max_bytes = max_bytes
+        self.horizon = horizon
+        self.row_bytes = (horizon + 1) * 8 + 32
+        self._slabs = {}
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+
+    village_codes = staticmethod(village_codes)
+
+    @property
+    def current_bytes(self):
+        # Counts cached villages; the row buffers may hold up to twice that while they grow
+        return sum(len(slab) for slab in self._slabs.values()) * self.row_bytes
+
+    def covers(self, years_since):
+        """Whether every requested year (as years since the base year) is inside the horizon"""
+        return (self.max_bytes > 0 and years_since.size > 0
+                and 0 <= years_since.min() and years_since.max() <= self.horizon)
+
+    def lookup(self, partition, codes, positions, population, columns):
+        """
+        (found, rows): mask of the villages cached for partition, and their rows
+        restricted to columns (years since the base year)
+        """
+        with self._lock:
+            self._tick += 1
+            slab = self._slabs.get(partition)
+            if slab is None:
+                found = np.zeros(len(codes), dtype=bool)
+                rows = np.empty((0, len(columns)), dtype=np.int64)
+            else:
+                index = slab.find(codes, positions, population)
+                found = index >= 0
+                index = index[found]
+                slab.used[index] = self._tick
+                rows = slab.rows(index, columns)
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(codes) - hits
+        return found, rows
+
+    def store(self, partition, codes, positions, population, rows):
+        """Caches full-horizon rows for villages with a known code, then evicts beyond max_bytes"""
+        valid = codes >= 0
+        codes, first = np.unique(codes[valid], return_index=True)
+        positions = positions[valid][first]
+        population = population[valid][first]
+        rows = rows[valid][first]
+        with self._lock:
+            slab = self._slabs.setdefault(partition, _Slab(self.horizon + 1))
+            slab.merge(codes, positions, population, self._tick, rows)
+            self._evict()
+
+    def _evict(self):
+        excess = -(-(self.current_bytes - self.max_bytes) // self.row_bytes)
+        if excess <= 0:
+            return
+        partitions = list(self._slabs)
+        used = np.concatenate([self._slabs[partition].used for partition in partitions])
+        owner = np.concatenate([np.full(len(self._slabs[partition]), i) for i, partition in enumerate(partitions)])
+        local = np.concatenate([np.arange(len(self._slabs[partition])) for partition in partitions])
+        drop = np.argsort(used, kind='stable')[:excess]
+        for i, partition in enumerate(partitions):
+            slab = self._slabs[partition]
+            mask = np.ones(len(slab), dtype=bool)
+            mask[local[drop[owner[drop] == i]]] = False
+            slab.keep(mask)
+            if not len(slab):
+                del self._slabs[partition]
+
+    def clear(self):
+        with self._lock:
+            self._slabs.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'villages': sum(len(slab) for slab in self._slabs.values()),
+                'partitions': len(self._slabs),
+                'horizon': self.horizon,
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_projection_memo = None
+_projection_memo_lock = threading.Lock()
+
+
+def get_projection_memo():
+    global _projection_memo
+    if _projection_memo is None:
+        with _projection_memo_lock:
+            if _projection_memo is None:
+                _projection_memo = ProjectionMemo(
+                    max_bytes=getattr(settings, 'PROJECTION_MEMO_MAX_BYTES', DEFAULT_MAX_BYTES),
+                    horizon=getattr(settings, 'PROJECTION_MEMO_HORIZON', DEFAULT_HORIZON),
+                )
+    return _projection_memo
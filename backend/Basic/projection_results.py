@@ -0,0 +1,163 @@
+import secrets
+
+import numpy as np
+from django.core.cache import cache
+
+from .backtest import BEST_FIT, best_fit_year_totals
+from .projection import (
+    PROJECTION_METHODS, VillageArrays, demographic_year_totals, format_totals, method_year_totals,
+)
+from .selections import selection_ttl
+from .villages import village_codes
+
+CACHE_PREFIX = 'basic:projection-result:'
+
+# Output key of each kind of projection, as the Time_series and Demographic endpoints return them
+TIME_SERIES = 'time_series'
+DEMOGRAPHIC = 'demographic'
+
+
+class StaleResult(Exception):
+    """The growth parameters changed since the result was computed, so a delta would mix two versions"""
+
+
+class ProjectionResult:
+    """
+    Per-year totals of a projection together with the villages they were summed
+    over (sorted village codes with their population and subdistrict), so a
+    later request can add and remove villages by adjusting the totals instead
+    of projecting the whole selection again. Every projection truncates per
+    village, so the adjusted totals equal a full recomputation. A Time_series
+    result kept with best_fit also adjusts its BestFit totals.
+
+    Only the projection work of a delta scales with the villages added and
+    removed. The member arrays are still copied once per delta (O(V) for V
+    villages, plain array copies without a re-sort), and store_result keeps
+    the full result under its new token.
+    """
+
+    def __init__(self, kind, base_year, years, subdistricts, exact, rates, best_fit, parameter_version, members, totals):
+        self.kind = kind
+        self.base_year = base_year
+        self.years = list(years)
+        self.subdistricts = subdistricts
+        self.exact = exact
+        self.rates = rates
+        self.best_fit = best_fit
+        self.parameter_version = parameter_version
+        # (codes, population, subdistrict_codes), sorted by village code
+        self.members = members
+        # {output key: (base_population, year_totals)}
+        self.totals = totals
+
+    def __len__(self):
+        return len(self.members[0])
+
+    def output(self):
+        """The response body of the endpoint that computed the result"""
+        return {key: format_totals(base, self.years, year_totals) for key, (base, year_totals) in self.totals.items()}
+
+    def _year_totals(self, villages, parameters, memo):
+        if self.kind == DEMOGRAPHIC:
+            return {'demographic': demographic_year_totals(self.base_year, self.years, villages, self.rates, self.exact)}
+        totals = {
+            method: method_year_totals(
+                method, self.base_year, self.years, villages, parameters, self.subdistricts, self.exact, memo
+            )
+            for method in PROJECTION_METHODS
+        }
+        if self.best_fit:
+            totals[BEST_FIT] = best_fit_year_totals(
+                self.base_year, self.years, villages, parameters, self.subdistricts, self.exact, memo
+            )
+        return totals
+
+    def apply_delta(self, added, removed_ids, parameters, memo=None):
+        """
+        A new ProjectionResult with the added villages (VillageArrays) projected and
+        summed in and the removed village IDs subtracted with the population and
+        subdistrict they were projected with. Raises ValueError for villages added
+        twice or removed without being part of the result.
+
+        Projecting costs O(added + removed). Updating the sorted members costs one
+        O(V) copy: removed rows are deleted, and the sorted added villages are
+        inserted at their searchsorted positions.
+        """
+        if self.kind != DEMOGRAPHIC and parameters.version != self.parameter_version:
+            raise StaleResult()
+        codes, population, subdistrict_codes = self.members
+
+        added_codes = village_codes(added.ids)
+        if (added_codes < 0).any():
+            raise ValueError('added villages need numeric village codes')
+        if len(np.unique(added_codes)) != len(added_codes) or np.isin(added_codes, codes).any():
+            raise ValueError('added villages are already part of the result')
+
+        removed_codes = village_codes(removed_ids)
+        rows = np.searchsorted(codes, removed_codes).clip(max=max(len(codes) - 1, 0))
+        if (len(removed_codes) and not len(codes)) or (removed_codes < 0).any() \
+                or (codes[rows] != removed_codes).any() or len(np.unique(rows)) != len(rows):
+            raise ValueError('removed villages are not part of the result')
+        removed = VillageArrays.from_columns(codes[rows].tolist(), population[rows], subdistrict_codes[rows].tolist())
+
+        added_totals = self._year_totals(added, parameters, memo)
+        removed_totals = self._year_totals(removed, parameters, memo)
+        totals = {}
+        for key, (base, year_totals) in self.totals.items():
+            totals[key] = (
+                base + added_totals[key][0] - removed_totals[key][0],
+                year_totals + added_totals[key][1] - removed_totals[key][1],
+            )
+
+        kept_codes = np.delete(codes, rows)
+        order = np.argsort(added_codes, kind='stable')
+        positions = np.searchsorted(kept_codes, added_codes[order])
+        members = (
+            np.insert(kept_codes, positions, added_codes[order]),
+            np.insert(np.delete(population, rows), positions, added.population.astype(np.int64)[order]),
+            np.insert(np.delete(subdistrict_codes, rows), positions,
+                      np.asarray(added.subdistrict_codes, dtype=np.int64)[order]),
+        )
+        return ProjectionResult(
+            self.kind, self.base_year, self.years, self.subdistricts, self.exact, self.rates, self.best_fit,
+            self.parameter_version, members, totals,
+        )
+
+
+def compute_result(kind, base_year, years, villages, parameters, subdistricts=None, exact=True, rates=None,
+                   best_fit=False, memo=None):
+    """
+    ProjectionResult of a full Time_series (kind=TIME_SERIES, with BestFit totals
+    when best_fit) or Demographic (kind=DEMOGRAPHIC, with rates) request. Raises ValueError when a village has
+    no numeric code or a subdistrict that is not a number, as such villages
+    could not be removed again.
+    """
+    codes = village_codes(villages.ids)
+    if (codes < 0).any():
+        raise ValueError('every village needs a numeric village code')
+    order = np.argsort(codes, kind='stable')
+    members = (
+        codes[order],
+        villages.population.astype(np.int64)[order],
+        np.asarray(villages.subdistrict_codes, dtype=np.int64)[order],
+    )
+    result = ProjectionResult(
+        kind, base_year, years, subdistricts, exact, rates, best_fit and kind == TIME_SERIES,
+        parameters.version, members, {},
+    )
+    result.totals = result._year_totals(villages, parameters, memo)
+    return result
+
+
+def store_result(result):
+    """Stores the result in the Django cache and returns its token"""
+    token = secrets.token_urlsafe(16)
+    cache.set(CACHE_PREFIX + token, result, timeout=selection_ttl())
+    return token
+
+
+def get_result(token):
+    """The ProjectionResult stored under token, or None when it is unknown or expired"""
+    if not isinstance(token, str) or not token:
+        return None
+    return cache.get(CACHE_PREFIX + token)
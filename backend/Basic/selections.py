@@ -0,0 +1,108 @@
+import secrets
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Basic_village
+from .projection import VillageArrays, requested_subdistrict_codes
+from .villages import correct_village_subdistricts, village_code_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds a selection handle stays valid after it was registered or last used
+DEFAULT_TTL = 60 * 60
+
+CACHE_PREFIX = 'basic:selection:'
+
+
+class Selection:
+    """
+    A registered village selection, kept as columns instead of the villages_props
+    dicts so calculation requests only send its handle.
+    """
+
+    def __init__(self, ids, population, subdistrict_codes, requested_subdistricts, from_subdistricts=False):
+        self.ids = list(ids)
+        self.population = np.asarray(population, dtype=np.int64)
+        self.subdistrict_codes = list(subdistrict_codes)
+        self.requested_subdistricts = sorted(requested_subdistricts)
+        # Whole-subdistrict selections filter the cohort table by subdistrict instead of a long village list
+        self.from_subdistricts = from_subdistricts
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def villages(self):
+        return VillageArrays.from_columns(self.ids, self.population, self.subdistrict_codes)
+
+    @property
+    def subdistrict_props(self):
+        """The subdistricts in the shape the frontend sends them ([{'id': ...}, ...])"""
+        return [{'id': code} for code in self.requested_subdistricts]
+
+    def village_codes(self):
+        codes = (village_code_key(village_id) for village_id in self.ids)
+        return [code for code in codes if code is not None]
+
+    def summary(self):
+        return {
+            'village_count': len(self),
+            'subdistrict_count': len(self.requested_subdistricts),
+            'total_population': self.population.sum().item(),
+        }
+
+
+def selection_from_subdistricts(subdistrict_codes):
+    """Every village of the given subdistricts, from one Basic_village query"""
+    codes = sorted({int(code) for code in subdistrict_codes})
+    rows = list(
+        Basic_village.objects.filter(subdistrict_code__in=codes)
+        .order_by('village_code')
+        .values_list('village_code', 'population_2011', 'subdistrict_code_id')
+    )
+    return Selection(
+        [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows],
+        codes, from_subdistricts=True,
+    )
+
+
+def selection_from_villages(villages, subdistrict):
+    """An explicit villages_props/subdistrict_props selection, with corrected subdistricts"""
+    correct_village_subdistricts(villages)
+    return Selection(
+        [village['id'] for village in villages],
+        [village['population'] for village in villages],
+        [village['subDistrictId'] for village in villages],
+        requested_subdistrict_codes(subdistrict),
+    )
+
+
+def selection_ttl():
+    return getattr(settings, 'SELECTION_HANDLE_TTL', DEFAULT_TTL)
+
+
+def register_selection(selection):
+    """Stores the selection in the Django cache and returns its handle"""
+    handle = secrets.token_urlsafe(16)
+    cache.set(CACHE_PREFIX + handle, selection, timeout=selection_ttl())
+    logger.info(f"Registered selection {handle} ({len(selection)} villages)")
+    return handle
+
+
+def get_selection(handle):
+    """The Selection registered under handle, or None when it is unknown or expired"""
+    if not isinstance(handle, str) or not handle:
+        return None
+    selection = cache.get(CACHE_PREFIX + handle)
+    if selection is not None:
+        # Handles in active use do not expire in the middle of a session
+        cache.touch(CACHE_PREFIX + handle, timeout=selection_ttl())
+    return selection
+
+
+def drop_selection(handle):
+    if isinstance(handle, str) and handle:
+        cache.delete(CACHE_PREFIX + handle)
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Basic_village, Population_2011
+from .projection import invalidate_growth_parameters
+from .projection_memo import get_projection_memo
+from .villages import bump_village_data_version, invalidate_village_subdistricts
+
+
+# Growth parameters are cached per process; any change to the census history
+# made through the ORM recomputes them on the next projection request.
+# Bulk loads that bypass model signals (queryset.update(), raw SQL) should call
+# invalidate_growth_parameters() themselves.
+@receiver([post_save, post_delete], sender=Population_2011)
+def population_2011_changed(sender, **kwargs):
+    invalidate_growth_parameters()
+    # Memoized rows are keyed by parameter version and would never be hit again
+    get_projection_memo().clear()
+
+
+@receiver([post_save, post_delete], sender=Basic_village)
+def basic_village_changed(sender, **kwargs):
+    invalidate_village_subdistricts()
+    # Cached catchment populations read village populations
+    bump_village_data_version()
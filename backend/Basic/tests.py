@@ -1,3 +1,175 @@
+import math
+import random
+
 from django.test import TestCase
+from django.urls import reverse
+
+from .models import Population_2011
+from .projection import invalidate_growth_parameters
+from . import service
+
+BASE_YEAR = 2011
+CENSUS_FIELDS = ['population_1951', 'population_1961', 'population_1971', 'population_1981',
+                 'population_1991', 'population_2001', 'population_2011']
+
+
+def reference_parameters(row):
+    """Per-subdistrict parameters exactly as the original per-row service functions computed them"""
+    p = [row[field] for field in CENSUS_FIELDS]
+    d = [p[i + 1] - p[i] for i in range(6)]
+    growth = [(d[i] * 100) / p[i] if p[i] else 0 for i in range(6)]
+    valid = [g for g in growth if g > 0]
+    product = 1
+    for g in valid:
+        product *= g
+    x = [year - BASE_YEAR for year in range(1951, 2012, 10)]
+    y = [math.log(value, 10) for value in p]
+    x_y_prod_sum = sum(xi * yi for xi, yi in zip(x, y))
+    return {
+        'arithmetic': math.floor(((p[6] - p[0]) / 6) / 10),
+        'geometric': round(math.pow(product, 1 / len(valid)) if valid else 0, 4),
+        'd_mean': sum(d) / 6,
+        'm_mean': sum(d[i + 1] - d[i] for i in range(5)) / 5,
+        'exponential': ((7 * x_y_prod_sum) - sum(x) * sum(y)) / (7 * sum(v ** 2 for v in x) - sum(x) ** 2),
+        'total_p7': p[6],
+    }
+
+
+def reference_village(method, value, parameters, year):
+    """One village's projection with the original per-village formula, truncated with int()"""
+    if method == 'Arithmetic':
+        return int(value + ((parameters['arithmetic'] * (year - BASE_YEAR)) * (value / parameters['total_p7'])))
+    if method == 'Geometric':
+        return int(value * (math.pow((1 + (parameters['geometric'] / 100)), (year - BASE_YEAR) / 10)))
+    if method == 'Incremental':
+        n = (year - BASE_YEAR) / 10
+        k = value / parameters['total_p7']
+        return int(value + k * n * parameters['d_mean'] + ((n * (n + 1)) * parameters['m_mean'] / 2) * k)
+    return int(value * math.exp(parameters['exponential'] * (year - BASE_YEAR)))
+
+
+class ProjectionFixture(TestCase):
+    """Census histories of a few subdistricts and a few hundred villages spread over them"""
+
+    METHODS = ['Arithmetic', 'Geometric', 'Incremental', 'Exponential']
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(2011)
+        rows = []
+        for code in range(1000, 1012):
+            history = [rng.randint(5000, 400000)]
+            for _ in range(6):
+                history.append(int(history[-1] * rng.uniform(0.92, 1.45)))
+            rows.append(Population_2011(subdistrict_code=code, region_name=f'S{code}',
+                                        **dict(zip(CENSUS_FIELDS, history))))
+        Population_2011.objects.bulk_create(rows)
+        cls.subdistrict = [{'id': row.subdistrict_code} for row in rows]
+        cls.parameters = {row.subdistrict_code: reference_parameters(row.__dict__) for row in rows}
+        cls.villages = [
+            {'id': 500000 + i, 'population': rng.randint(0, 25000), 'subDistrictId': rng.choice(rows).subdistrict_code}
+            for i in range(400)
+        ]
+
+    def setUp(self):
+        # bulk_create skips the Population_2011 signal that recomputes the cached parameters
+        invalidate_growth_parameters()
+
+    def reference_totals(self, method, villages, years):
+        totals = {'2011': sum(village['population'] for village in villages)}
+        for year in years:
+            totals[year] = sum(
+                reference_village(method, village['population'], self.parameters[village['subDistrictId']], year)
+                for village in villages
+            )
+        return totals
+
+
+class VectorizedTotalsTests(ProjectionFixture):
+    """The vectorized projections (user-012) sum to exactly the original per-village totals"""
+
+    def test_range_totals_match_per_village_formulas(self):
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                totals = getattr(service, f'{method}_population_range')(
+                    BASE_YEAR, 2011, 2060, [dict(village) for village in self.villages], self.subdistrict
+                )
+                self.assertEqual(totals, self.reference_totals(method, self.villages, range(2011, 2061)))
+
+    def test_single_year_totals_match_per_village_formulas(self):
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                totals = getattr(service, f'{method}_population_single_year')(
+                    BASE_YEAR, 2047, [dict(village) for village in self.villages], self.subdistrict
+                )
+                self.assertEqual(totals, self.reference_totals(method, self.villages, [2047]))
+
+
+class ExactTimeSeriesTests(ProjectionFixture):
+    """Time_series with exact=true, or without exact (user-015), answers the original per-village totals"""
+
+    def post(self, **data):
+        body = {'year': '', 'start_year': 2011, 'end_year': 2040,
+                'villages_props': self.villages, 'subdistrict_props': self.subdistrict, **data}
+        response = self.client.post(reverse('time_series'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expected(self, method, years):
+        return {str(year): total for year, total in self.reference_totals(method, self.villages, years).items()}
+
+    def test_exact_range_matches_per_village_formulas(self):
+        for data in ({'exact': True}, {}):
+            output = self.post(**data)
+            for method in self.METHODS:
+                with self.subTest(method=method, **data):
+                    self.assertEqual(output[method], self.expected(method, range(2011, 2041)))
+
+    def test_exact_single_year_matches_per_village_formulas(self):
+        output = self.post(year=2036, exact='true')
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                self.assertEqual(output[method], self.expected(method, [2036]))
+
+
+class ResultDeltaTests(ProjectionFixture):
+    """Totals adjusted by added and removed villages (user-019) equal a full recomputation"""
+
+    def post(self, villages, **data):
+        body = {'year': '', 'start_year': 2011, 'end_year': 2040,
+                'villages_props': [dict(village) for village in villages], 'subdistrict_props': self.subdistrict, **data}
+        response = self.client.post(reverse('time_series'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_delta_equals_full_recomputation(self):
+        for exact in (True, False):
+            with self.subTest(exact=exact):
+                kept = self.post(self.villages[:300], exact=exact, keep_result=True)
+                added = self.villages[300:]
+                removed = [village['id'] for village in self.villages[:40]]
+                delta = self.post([], result_token=kept['X-Result-Token'], added=added, removed=removed)
+                full = self.post(self.villages[40:], exact=exact)
+                self.assertEqual(delta.json(), full.json())
+
+                # A second delta on the adjusted result, putting the removed villages back
+                again = self.post([], result_token=delta['X-Result-Token'], added=self.villages[:40], removed=[])
+                self.assertEqual(again.json(), self.post(self.villages, exact=exact).json())
+
+    def test_exact_delta_matches_per_village_formulas(self):
+        kept = self.post(self.villages[:200], keep_result=True)
+        delta = self.post([], result_token=kept['X-Result-Token'], added=self.villages[200:],
+                          removed=[village['id'] for village in self.villages[:50]])
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                expected = self.reference_totals(method, self.villages[50:], range(2011, 2041))
+                self.assertEqual(delta.json()[method], {str(year): total for year, total in expected.items()})
+
+    def test_best_fit_is_kept_and_adjusted(self):
+        kept = self.post(self.villages[:300], keep_result=True, best_fit=True)
+        self.assertEqual(kept.json(), self.post(self.villages[:300], best_fit=True).json())
+        self.assertIn('BestFit', kept.json())
 
-# Create your tests here.
+        delta = self.post([], result_token=kept['X-Result-Token'], added=self.villages[300:],
+                          removed=[village['id'] for village in self.villages[:40]])
+        self.assertEqual(delta.json(), self.post(self.villages[40:], best_fit=True).json())
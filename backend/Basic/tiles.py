@@ -0,0 +1,140 @@
+import os
+import logging
+
+import numpy as np
+import shapely
+from django.conf import settings
+
+from mapplot.layers import SHAPEFILE_PATHS
+from .layer_cache import get_layer_cache, layer_mtime
+
+try:
+    import mapbox_vector_tile
+except ImportError:  # tiles are unavailable without it; the GeoJSON endpoints keep working
+    mapbox_vector_tile = None
+
+logger = logging.getLogger(__name__)
+
+# Tile layers served by the MVT endpoint, relative to MEDIA_ROOT
+TILE_LAYERS = {
+    'state': os.path.join('basic_shape', 'B_State', 'B_State.shp'),
+    'district': os.path.join('basic_shape', 'B_district', 'B_district.shp'),
+    'subdistrict': os.path.join('basic_shape', 'B_subdistrict', 'B_subdistrict.shp'),
+    'villages': os.path.join('basic_shape', 'B_villages', 'basin_village.shp'),
+    'basin': os.path.join('Drain_shp', 'Basin', 'Catchment_Basin_Diss.shp'),
+    'rivers': os.path.join('Drain_shp', 'Rivers', 'Rivers.shp'),
+    'stretches': os.path.join('Drain_shp', 'River_Stretches', 'Stretches.shp'),
+    'drains': os.path.join('Drain_shp', 'Drains', 'Drain.shp'),
+    'catchments': os.path.join('Drain_shp', 'Catchments', 'Catchment.shp'),
+    'drain-villages': os.path.join('Drain_shp', 'Villages', 'basin_village.shp'),
+}
+# mapplot layers are exposed as "<category>-<subcategory>", e.g. "household-Varanasi"
+for _category, _subcategories in SHAPEFILE_PATHS.items():
+    for _subcategory, _relative_path in _subcategories.items():
+        TILE_LAYERS[f'{_category}-{_subcategory}'] = _relative_path
+
+TILE_EXTENT = 4096
+# Features are clipped slightly outside the tile so strokes do not show seams at tile edges
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+
+
+def get_tile_cache_root():
+    return getattr(settings, 'TILE_CACHE_ROOT', os.path.join(settings.MEDIA_ROOT, 'tile_cache'))
+
+
+def tile_bounds(z, x, y):
+    """EPSG:3857 bounds (minx, miny, maxx, maxy) of an XYZ tile"""
+    size = 2 * WEB_MERCATOR_HALF_WORLD / (2 ** z)
+    minx = -WEB_MERCATOR_HALF_WORLD + x * size
+    maxy = WEB_MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def to_mvt_value(value):
+    """Converts an attribute to a type MVT can store, or None to drop it"""
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return str(value)
+
+
+class TileSource:
+    """
+    Web-mercator geometries of a layer with an STRtree over them.
+    Built once per loaded layer version by the layer cache.
+    """
+
+    def __init__(self, gdf):
+        projected = gdf.geometry.to_crs(3857) if gdf.crs else gdf.geometry
+        self.geometries = np.asarray(projected.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        self.attributes = gdf.drop(columns=gdf.geometry.name)
+
+    @property
+    def nbytes(self):
+        return int(shapely.get_num_coordinates(self.geometries).sum()) * 16
+
+    def render(self, layer_name, z, x, y):
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        pixel = (maxx - minx) / TILE_EXTENT
+        buffer = TILE_BUFFER * pixel
+
+        candidates = self.tree.query(shapely.box(minx - buffer, miny - buffer, maxx + buffer, maxy + buffer))
+        candidates.sort()
+        clipped = shapely.clip_by_rect(
+            self.geometries[candidates], minx - buffer, miny - buffer, maxx + buffer, maxy + buffer
+        )
+        # Detail finer than half a tile pixel disappears in quantization anyway
+        clipped = shapely.simplify(clipped, pixel / 2, preserve_topology=True)
+        keep = ~shapely.is_empty(clipped)
+
+        records = self.attributes.iloc[candidates[keep]].to_dict('records')
+        features = []
+        for geometry, record in zip(clipped[keep], records):
+            properties = {}
+            for key, value in record.items():
+                value = to_mvt_value(value)
+                if value is not None:
+                    properties[key] = value
+            features.append({'geometry': geometry, 'properties': properties})
+
+        return mapbox_vector_tile.encode(
+            [{'name': layer_name, 'features': features}],
+            default_options={'quantize_bounds': (minx, miny, maxx, maxy), 'extents': TILE_EXTENT},
+        )
+
+
+def get_tile(layer_name, z, x, y):
+    """
+    Returns the encoded MVT bytes for a tile, from the on-disk tile cache if
+    present. The cache directory is keyed by the layer version (mtime), so
+    edited data never serves stale tiles.
+    Raises KeyError for unknown layers and FileNotFoundError for missing data.
+    """
+    path = os.path.join(settings.MEDIA_ROOT, TILE_LAYERS[layer_name])
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+
+    version = str(int(layer_mtime(path)))
+    cache_path = os.path.join(get_tile_cache_root(), layer_name, version, str(z), str(x), f'{y}.mvt')
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return f.read()
+
+    _, source = get_layer_cache().get_derived(path, 'tile_source', TileSource)
+    tile = source.render(layer_name, z, x, y)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(tile)
+    os.replace(tmp_path, cache_path)
+    return tile
@@ -0,0 +1,134 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from .projection import _years_since, included_villages
+
+logger = logging.getLogger(__name__)
+
+# Methods with a bootstrap: decadal increases (Arithmetic, Incremental), decadal
+# growth percentages (Geometric) and residuals of the log-linear fit (Exponential)
+UNCERTAINTY_METHODS = ('Arithmetic', 'Geometric', 'Incremental', 'Exponential')
+
+DEFAULT_SAMPLES = 2000
+MAX_SAMPLES = 20000
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+# Memory budget of one chunk of samples x subdistricts x years
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Sample x subdistrict x year cells above which a configured process pool is used
+POOL_MIN_CELLS = 50 * 1000 * 1000
+
+
+def simulation_inputs(method, base_year, years, villages, parameters, subdistricts=None):
+    """
+    Arrays the bootstrap of method needs for the subdistricts of the request, with
+    the villages summed per subdistrict (every method is linear in the population).
+    Returns (inputs, t); inputs holds plain arrays so it can be sent to worker processes.
+    """
+    if method not in UNCERTAINTY_METHODS:
+        raise ValueError(f"No uncertainty bootstrap for {method}")
+    included, positions = included_villages(method, villages, parameters, subdistricts)
+    used, inverse = np.unique(positions, return_inverse=True)
+    value = np.bincount(inverse, weights=villages.population[included], minlength=len(used))
+    history = parameters.history[used].astype(np.float64)
+    diffs = history[:, 1:] - history[:, :-1]
+
+    inputs = {'method': method, 'value': value, 'share': value / history[:, -1]}
+    if method in ('Arithmetic', 'Incremental'):
+        inputs['diffs'] = diffs
+        inputs['diff_changes'] = diffs[:, 1:] - diffs[:, :-1]
+    elif method == 'Geometric':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inputs['growth'] = np.where(history[:, :-1] != 0, diffs * 100 / history[:, :-1], 0.0)
+    else:
+        x = np.array(parameters.years, dtype=np.float64) - parameters.years[-1]
+        y = np.log10(history)
+        rate = parameters.exponential_rate[used]
+        fitted = (y.mean(axis=1) - rate * x.mean())[:, None] + rate[:, None] * x
+        inputs['rate'] = rate
+        inputs['residuals'] = y - fitted
+        inputs['x_weights'] = (x - x.mean()) / ((x - x.mean()) ** 2).sum()
+    return inputs, _years_since(base_year, years)[0].astype(np.float64)
+
+
+def _resample(rng, values, samples):
+    """values (subdistricts x k) resampled with replacement per subdistrict: samples x subdistricts x k"""
+    count, k = values.shape
+    picks = rng.integers(0, k, size=(samples, count, k))
+    return values[np.arange(count)[None, :, None], picks]
+
+
+def simulate_chunk(inputs, t, samples, seed):
+    """Per-year totals (samples x years) of one chunk of bootstrap samples"""
+    rng = np.random.default_rng(seed)
+    method = inputs['method']
+    value, share = inputs['value'], inputs['share']
+    if not len(value):
+        return np.zeros((samples, len(t)))
+
+    if method == 'Arithmetic':
+        rate = np.floor(_resample(rng, inputs['diffs'], samples).mean(axis=2) / 10)
+        return value.sum() + (rate * share).sum(axis=1)[:, None] * t[None, :]
+    if method == 'Incremental':
+        d_mean = _resample(rng, inputs['diffs'], samples).mean(axis=2)
+        m_mean = _resample(rng, inputs['diff_changes'], samples).mean(axis=2)
+        n = t / 10
+        return (value.sum() + (share * d_mean).sum(axis=1)[:, None] * n[None, :]
+                + (share * m_mean).sum(axis=1)[:, None] * (n * (n + 1) / 2)[None, :])
+
+    if method == 'Geometric':
+        growth = _resample(rng, inputs['growth'], samples)
+        positive = growth > 0
+        count = positive.sum(axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_mean = np.where(positive, np.log(np.where(positive, growth, 1.0)), 0.0).sum(axis=2) / count
+        rate = np.where(count > 0, np.exp(log_mean), 0.0)
+        factors = (1 + rate / 100)[:, :, None] ** (t / 10)[None, None, :]
+    else:
+        residuals = _resample(rng, inputs['residuals'], samples)
+        rate = inputs['rate'][None, :] + residuals @ inputs['x_weights']
+        factors = np.exp(rate[:, :, None] * t[None, None, :])
+    return np.einsum('nsy,s->ny', factors, value)
+
+
+def simulate_totals(inputs, t, samples, seed=None, workers=None):
+    """
+    Per-year totals of samples bootstrap draws (samples x years), in chunks that
+    keep the samples x subdistricts x years arrays under CHUNK_BYTES. Chunks run in
+    a process pool of PROJECTION_UNCERTAINTY_WORKERS processes when the
+    simulation is large enough; results do not depend on the pool.
+    """
+    cells_per_sample = max(len(inputs['value']) * max(len(t), 1), 1)
+    chunk_samples = max(1, min(samples, CHUNK_BYTES // (cells_per_sample * 8 * 2)))
+    sizes = [min(chunk_samples, samples - start) for start in range(0, samples, chunk_samples)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None:
+        workers = getattr(settings, 'PROJECTION_UNCERTAINTY_WORKERS', 0)
+    if workers > 1 and len(sizes) > 1 and samples * cells_per_sample >= POOL_MIN_CELLS:
+        logger.info(f"Simulating {samples} samples in {len(sizes)} chunks on {workers} processes")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(simulate_chunk, [inputs] * len(sizes), [t] * len(sizes), sizes, seeds))
+    else:
+        chunks = [simulate_chunk(inputs, t, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    return np.concatenate(chunks)
+
+
+def uncertainty_bands(method, base_year, years, villages, parameters, subdistricts=None,
+                      samples=DEFAULT_SAMPLES, percentiles=DEFAULT_PERCENTILES, seed=None):
+    """
+    Percentile bands of the projected totals: {"p5": {year: total, ...}, ...}.
+    Bands come from subdistrict totals, so they skip the per-village int()
+    truncation of the point projections.
+    """
+    inputs, t = simulation_inputs(method, base_year, years, villages, parameters, subdistricts)
+    totals = simulate_totals(inputs, t, samples, seed)
+    bands = np.percentile(totals, percentiles, axis=0)
+    return {
+        f'p{percentile:g}': {int(year): int(round(value)) for year, value in zip(years, band.tolist())}
+        for percentile, band in zip(percentiles, bands)
+    }
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import VillagePopulationRawSQL, VillagePopulationAPI,MultipleVillagesAPI, VillagesCatchmentIntersection, AllStretches, Catchments, BasinAPI, RiverMapAPI, RiverStretched, Drain, CohortView, DefaultBaseMapAPI, StateShapefileAPI, MultipleDistrictsAPI,MultipleSubdistrictsAPI, Locations_stateAPI,Locations_districtAPI,Locations_subdistrictAPI,Locations_villageAPI,Time_series,Demographic,SewageCalculation,WaterSupplyCalculationAPI,DomesticWaterDemandCalculationAPIView,FloatingWaterDemandCalculationAPIView,InstitutionalWaterDemandCalculationAPIView,FirefightingWaterDemandCalculationAPIView
+from .views import UncertaintyAPI, BacktestAPI, ProjectionExportAPI, SelectionAPI, BatchProjectionAPI, CatchmentPopulationAPI, VectorTileAPI, LayerCacheStatsAPI, VillagePopulationRawSQL, VillagePopulationAPI,MultipleVillagesAPI, VillagesCatchmentIntersection, AllStretches, Catchments, BasinAPI, RiverMapAPI, RiverStretched, Drain, CohortView, DefaultBaseMapAPI, StateShapefileAPI, MultipleDistrictsAPI,MultipleSubdistrictsAPI, Locations_stateAPI,Locations_districtAPI,Locations_subdistrictAPI,Locations_villageAPI,Time_series,Demographic,SewageCalculation,WaterSupplyCalculationAPI,DomesticWaterDemandCalculationAPIView,FloatingWaterDemandCalculationAPIView,InstitutionalWaterDemandCalculationAPIView,FirefightingWaterDemandCalculationAPIView
 urlpatterns = [
     path("",Locations_stateAPI.as_view(),name="states"),
     path("district/",Locations_districtAPI.as_view(),name="districts"),
@@ -7,6 +7,11 @@ urlpatterns = [
     path("village/",Locations_villageAPI.as_view(),name="villages"),
     path("time_series/arthemitic/",Time_series.as_view(),name="time_series"),
     path("time_series/demographic/",Demographic.as_view(),name="demographic"),
+    path("time_series/batch/",BatchProjectionAPI.as_view(),name="time_series_batch"),
+    path("time_series/export/",ProjectionExportAPI.as_view(),name="time_series_export"),
+    path("time_series/backtest/",BacktestAPI.as_view(),name="time_series_backtest"),
+    path("time_series/uncertainty/",UncertaintyAPI.as_view(),name="time_series_uncertainty"),
+    path("selection/",SelectionAPI.as_view(),name="selection"),
     path("sewage_calculation/",SewageCalculation.as_view(), name="sewage_calculation"),
     path("sewage_calculation/total_population/",SewageCalculation.as_view(), name="total_population"),
     path("water_supply/", WaterSupplyCalculationAPI.as_view(), name="water_supply"),
@@ -26,7 +31,10 @@ urlpatterns = [
     path('catchment/', Catchments.as_view(), name='catchment'),
     path('all-stretches/', AllStretches.as_view(), name='all-stretches'),
     path('catchment_village/', VillagesCatchmentIntersection.as_view(),name='catchment_village'),
+    path('catchment-population/', CatchmentPopulationAPI.as_view(), name='catchment-population'),
     path('multiple-villages/', MultipleVillagesAPI.as_view(), name='multiple-villages-api'),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt', VectorTileAPI.as_view(), name='vector-tile'),
+    path('layer-cache-stats/', LayerCacheStatsAPI.as_view(), name='layer-cache-stats'),
     path('village-population/', VillagePopulationAPI.as_view(), name='village-population'),
       path('village-population-raw/', VillagePopulationRawSQL.as_view(), name='village-population-raw')
 ]
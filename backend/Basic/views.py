@@ -8,14 +8,37 @@ import math
 from .service import *
 from django.db.models import Sum, Q
 from .models import PopulationCohort
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 import os
 import json
 import geopandas as gpd
 import pandas as pd 
+import numpy as np
 from django.conf import settings
 import traceback
 import logging
+from .layer_cache import load_layer, load_layer_with_index, get_layer_cache
+from .villages import bulk_village_lookup, correct_village_subdistricts, village_codes, village_data_version
+from .projection import (
+    BATCH_METHODS, DEMOGRAPHIC, PROJECTION_METHODS, VillageArrays, as_village_arrays, batch_projection, get_growth_parameters,
+    method_totals, requested_subdistrict_codes,
+)
+from .projection_memo import get_projection_memo
+from .backtest import BEST_FIT, get_backtest
+from .cohort_projection import CohortSchedules, cohort_pyramids
+from .uncertainty import DEFAULT_PERCENTILES, DEFAULT_SAMPLES, MAX_SAMPLES, UNCERTAINTY_METHODS, uncertainty_bands
+from .projection_export import EXPORT_FORMATS, export_formats, projection_frames, stream_export
+from .projection_results import DEMOGRAPHIC as DEMOGRAPHIC_RESULT, TIME_SERIES, StaleResult, compute_result, get_result, store_result
+from .selections import (
+    drop_selection, get_selection, register_selection, selection_from_subdistricts, selection_from_villages,
+    selection_ttl,
+)
+from .layer_index import canonical_code
+from .layer_lod import load_layer_lod, requested_lod_level
+from . import tiles
+from .geojson_cache import cached_geojson_response, geojson_response, get_geojson_cache
+from .layer_query import requested_feature_filter, select_features
+from .catchment_membership import catchment_layer_path, village_layer_path, intersecting_pairs, catchment_overlaps
 
 logger = logging.getLogger(__name__)
 
@@ -49,18 +72,160 @@ class Locations_villageAPI(APIView):
         sorted_data = sorted(serial.data, key=lambda x: x['village_name'])
         return Response(sorted_data, status=status.HTTP_200_OK)
 
+def request_summary(request):
+    """request.data for the debug print, with the village and subdistrict lists reduced to their length"""
+    summary = {}
+    for key, value in request.data.items():
+        if key in ('villages_props', 'subdistrict_props') and isinstance(value, list):
+            summary[key] = f'{len(value)} items'
+        else:
+            summary[key] = value
+    return summary
+
+
+def requested_villages(request):
+    """
+    (villages, subdistrict, error_response) of a projection request: the registered
+    selection when a 'selection' handle is sent, else villages_props/subdistrict_props
+    with each village's subdistrict corrected against Basic_village.
+    """
+    handle = request.data.get('selection')
+    if handle:
+        selection = get_selection(handle)
+        if selection is None:
+            return None, None, Response({'error': 'Unknown or expired selection handle'}, status=status.HTTP_404_NOT_FOUND)
+        return selection.villages, selection.subdistrict_props, None
+
+    villages = request.data.get('villages_props')
+    subdistrict = request.data.get('subdistrict_props')
+    if not isinstance(villages, list) or not isinstance(subdistrict, list):
+        return None, None, Response(
+            {'error': 'villages_props and subdistrict_props (or a selection handle) are required'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    # Correcting the subdistrict_id of the villages coming from frontend
+    # against the resident village -> subdistrict map (only the requested villages are looked up)
+    correct_village_subdistricts(villages)
+    return villages, subdistrict, None
+
+
+def requested_years(single_year, start_year, end_year):
+    """Years of a projection request: the single year, else start_year..end_year, else none"""
+    if single_year:
+        return [int(single_year)]
+    if start_year and end_year:
+        return list(range(int(start_year), int(end_year) + 1))
+    return []
+
+
+def kept_result_response(kind, years, villages, subdistrict, exact, rates=None, best_fit=False):
+    """
+    Projects the request through a ProjectionResult and keeps it, returning its
+    token in the X-Result-Token header (the body stays in the endpoint's shape).
+    """
+    try:
+        result = compute_result(
+            kind, 2011, years, as_village_arrays(villages), get_growth_parameters(),
+            subdistricts=requested_subdistrict_codes(subdistrict), exact=exact, rates=rates, best_fit=best_fit,
+            memo=get_projection_memo(),
+        )
+    except (TypeError, ValueError) as e:
+        return Response({'error': f'Cannot keep this result: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    response = Response(result.output(), status=status.HTTP_200_OK)
+    response['X-Result-Token'] = store_result(result)
+    return response
+
+
+def projection_delta_response(request, kind):
+    """
+    Answers {'result_token', 'added': [villages_props...], 'removed': [village ids]}
+    by adjusting the kept result's totals by the added and removed villages only.
+    The adjusted result is kept under a new token; the old token stays valid.
+    """
+    previous = get_result(request.data.get('result_token'))
+    if previous is None or previous.kind != kind:
+        return Response({'error': 'Unknown or expired result token'}, status=status.HTTP_404_NOT_FOUND)
+
+    added = request.data.get('added') or []
+    removed = request.data.get('removed') or []
+    if not isinstance(added, list) or not isinstance(removed, list):
+        return Response({'error': 'added and removed must be lists'}, status=status.HTTP_400_BAD_REQUEST)
+    # Removed villages may be sent as IDs or as the villages_props dicts
+    removed = [village['id'] if isinstance(village, dict) else village for village in removed]
+
+    try:
+        correct_village_subdistricts(added)
+        result = previous.apply_delta(as_village_arrays(added), removed, get_growth_parameters(), get_projection_memo())
+    except StaleResult:
+        return Response({'error': 'Census data changed since this result; request the full projection again'},
+                        status=status.HTTP_409_CONFLICT)
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({'error': f'Invalid delta: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.info(f"Adjusted result by {len(added)} added and {len(removed)} removed villages ({len(result)} villages)")
+    response = Response(result.output(), status=status.HTTP_200_OK)
+    response['X-Result-Token'] = store_result(result)
+    return response
+
+
+class SelectionAPI(APIView):
+    """
+    Registers a village selection and returns a short-lived handle that the
+    projection and cohort endpoints accept as 'selection' instead of the
+    villages_props/subdistrict_props arrays.
+
+    POST {"subdistrict_codes": [...]}                        every village of those subdistricts
+    POST {"villages_props": [...], "subdistrict_props": [...]} an explicit village list
+    DELETE {"selection": handle}                               drops a handle early
+    """
+    def post(self, request, format=None):
+        subdistrict_codes = request.data.get('subdistrict_codes')
+        villages = request.data.get('villages_props')
+        try:
+            if subdistrict_codes:
+                if not isinstance(subdistrict_codes, list):
+                    subdistrict_codes = [subdistrict_codes]
+                selection = selection_from_subdistricts(subdistrict_codes)
+            elif isinstance(villages, list) and villages:
+                selection = selection_from_villages(villages, request.data.get('subdistrict_props', []))
+            else:
+                return Response({'error': 'subdistrict_codes or villages_props is required'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({'error': f'Invalid selection: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not len(selection):
+            return Response({'error': 'The selection contains no villages'}, status=status.HTTP_400_BAD_REQUEST)
+
+        handle = register_selection(selection)
+        return Response({'selection': handle, 'expires_in': selection_ttl(), **selection.summary()},
+                        status=status.HTTP_201_CREATED)
+
+    def delete(self, request, format=None):
+        drop_selection(request.data.get('selection'))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class Demographic(APIView):
     def post(self, request, format=None):
         
         base_year = 2011
-        # Get data from request
-        print('request_data is ',request.data)
+        # Get data from request (without the village list, which can run to megabytes)
+        print('request_data is ', request_summary(request))
+        # A result_token with added/removed villages adjusts a kept result instead of projecting again
+        if request.data.get('result_token'):
+            return projection_delta_response(request, DEMOGRAPHIC_RESULT)
         single_year = request.data['year']
         start_year = request.data['start_year']
         end_year = request.data['end_year']
-        villages = request.data['villages_props']
-        subdistrict = request.data['subdistrict_props']
-        total_population = request.data['totalPopulation_props']
+        villages, subdistrict, error = requested_villages(request)
+        if error is not None:
+            return error
+        total_population = request.data.get('totalPopulation_props')
+        # keep_result=true keeps the totals for later added/removed deltas (token in X-Result-Token)
+        keep_result = request.data.get('keep_result') in (True, 'true', 'True', 1, '1')
+        # exact=false projects the summed village population (faster, no per-village truncation)
+        exact = request.data.get('exact', True) not in (False, 'false', 'False', 0, '0')
         demographic = request.data['demographic']
 
         print(f"demographic {demographic}")
@@ -73,73 +238,269 @@ class Demographic(APIView):
         annual_death_rate = annual_death_rate/10000
         annual_emigration_rate = annual_emigration_rate/10000
         annual_immigration_rate = annual_immigration_rate/10000
-        
 
-        # Correcting the subdistrict_id of the villages coming from frontend 
-        # Fetch all villages from the database
-        village_data = Basic_village.objects.values('village_code', 'subdistrict_code')
-        # Create a mapping of village_code to subdistrict_code
-        village_mapping = {v['village_code']: v['subdistrict_code'] for v in village_data}
-        # Update the villages list with the correct subDistrictId
-        for village in villages:
-            village_code = village['id']
-            if village_code in village_mapping:
-                village['subDistrictId'] = village_mapping[village_code]
+        years = requested_years(single_year, start_year, end_year)
+        if keep_result and years:
+            rates = (annual_birth_rate, annual_death_rate, annual_emigration_rate, annual_immigration_rate)
+            return kept_result_response(DEMOGRAPHIC_RESULT, years, villages, subdistrict, exact, rates)
 
         main_output={}
 
         if single_year:
-            main_output['demographic'] = Demographic_population_single_year(base_year,single_year,villages,subdistrict,annual_birth_rate,annual_death_rate,annual_emigration_rate,annual_immigration_rate)  
+            main_output['demographic'] = Demographic_population_single_year(base_year,single_year,villages,subdistrict,annual_birth_rate,annual_death_rate,annual_emigration_rate,annual_immigration_rate,exact=exact)  
               
         elif start_year and end_year:
-            main_output['demographic'] = Demographic_population_range(base_year, start_year, end_year, villages, subdistrict, annual_birth_rate, annual_death_rate, annual_emigration_rate, annual_immigration_rate) 
+            main_output['demographic'] = Demographic_population_range(base_year, start_year, end_year, villages, subdistrict, annual_birth_rate, annual_death_rate, annual_emigration_rate, annual_immigration_rate, exact=exact) 
         print("output",main_output)
         return Response(main_output, status=status.HTTP_200_OK)    
 
 class Time_series(APIView):
     def post(self, request, format=None):
         base_year = 2011
-        # Get data from request
-        print('request_data is ',request.data)
+        # Get data from request (without the village list, which can run to megabytes)
+        print('request_data is ', request_summary(request))
+        # A result_token with added/removed villages adjusts a kept result instead of projecting again
+        if request.data.get('result_token'):
+            return projection_delta_response(request, TIME_SERIES)
         single_year = request.data['year']
         start_year = request.data['start_year']
         end_year = request.data['end_year']
-        villages = request.data['villages_props']
-        subdistrict = request.data['subdistrict_props']
-        total_population = request.data['totalPopulation_props']
-        
-
-        # Correcting the subdistrict_id of the villages coming from frontend 
-        # Fetch all villages from the database
-        village_data = Basic_village.objects.values('village_code', 'subdistrict_code')
-        # Create a mapping of village_code to subdistrict_code
-        village_mapping = {v['village_code']: v['subdistrict_code'] for v in village_data}
-        # Update the villages list with the correct subDistrictId
-        for village in villages:
-            village_code = village['id']
-            if village_code in village_mapping:
-                village['subDistrictId'] = village_mapping[village_code]
-
-
-
+        villages, subdistrict, error = requested_villages(request)
+        if error is not None:
+            return error
+        total_population = request.data.get('totalPopulation_props')
+        # exact=false sums villages per subdistrict before projecting (faster, no per-village truncation)
+        exact = request.data.get('exact', True) not in (False, 'false', 'False', 0, '0')
+        # keep_result=true keeps the totals for later added/removed deltas (token in X-Result-Token)
+        keep_result = request.data.get('keep_result') in (True, 'true', 'True', 1, '1')
+        # best_fit=true adds BestFit: each subdistrict projected by the method that best predicted 2011
+        best_fit = request.data.get('best_fit') in (True, 'true', 'True', 1, '1')
+
+        years = requested_years(single_year, start_year, end_year)
+        if keep_result and years:
+            return kept_result_response(TIME_SERIES, years, villages, subdistrict, exact, best_fit=best_fit)
 
         main_output={}
         if single_year:
-            main_output['Arithmetic']=Arithmetic_population_single_year(base_year,single_year,villages,subdistrict)
-            main_output['Geometric']=Geometric_population_single_year(base_year,single_year,villages,subdistrict)
-            main_output['Incremental']=Incremental_population_single_year(base_year,single_year,villages,subdistrict)
-            main_output['Exponential']=Exponential_population_single_year(base_year,single_year,villages,subdistrict)
+            main_output['Arithmetic']=Arithmetic_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
+            main_output['Geometric']=Geometric_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
+            main_output['Incremental']=Incremental_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
+            main_output['Exponential']=Exponential_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
+            main_output['Logistic']=Logistic_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
+            if best_fit:
+                main_output[BEST_FIT]=BestFit_population_single_year(base_year,single_year,villages,subdistrict,exact=exact)
 
         elif start_year and end_year:
-            main_output['Arithmetic']=Arithmetic_population_range(base_year,start_year,end_year,villages,subdistrict)  
-            main_output['Geometric']=Geometric_population_range(base_year,start_year,end_year,villages,subdistrict)
-            main_output['Incremental']=Incremental_population_range(base_year,start_year,end_year,villages,subdistrict)
-            main_output['Exponential']=Exponential_population_range(base_year,start_year,end_year,villages,subdistrict)
+            main_output['Arithmetic']=Arithmetic_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)  
+            main_output['Geometric']=Geometric_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)
+            main_output['Incremental']=Incremental_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)
+            main_output['Exponential']=Exponential_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)
+            main_output['Logistic']=Logistic_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)
+            if best_fit:
+                main_output[BEST_FIT]=BestFit_population_range(base_year,start_year,end_year,villages,subdistrict,exact=exact)
         else:
             pass
         print("output",main_output)
         return Response(main_output, status=status.HTTP_200_OK)
 
+# Planners compare many what-if scenarios over one village selection; the selection is
+# resolved once and every scenario is answered from the same projection pass
+MAX_BATCH_SCENARIOS = 100
+MAX_BATCH_YEARS = 200
+
+
+class BatchProjectionAPI(APIView):
+    def post(self, request, format=None):
+        base_year = 2011
+        scenarios = request.data.get('scenarios')
+        exact = request.data.get('exact', True) not in (False, 'false', 'False', 0, '0')
+
+        if not isinstance(scenarios, list) or not scenarios:
+            return Response({'error': 'scenarios must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(scenarios) > MAX_BATCH_SCENARIOS:
+            return Response({'error': f'At most {MAX_BATCH_SCENARIOS} scenarios per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        names = []
+        parsed = []
+        for i, scenario in enumerate(scenarios):
+            try:
+                if scenario.get('year'):
+                    years = [int(scenario['year'])]
+                else:
+                    start_year, end_year = int(scenario['start_year']), int(scenario['end_year'])
+                    if end_year < start_year or end_year - start_year >= MAX_BATCH_YEARS:
+                        raise ValueError(f'year range must be increasing and at most {MAX_BATCH_YEARS} years')
+                    years = list(range(start_year, end_year + 1))
+
+                demographic = scenario.get('demographic')
+                default_methods = list(PROJECTION_METHODS) + ([DEMOGRAPHIC] if demographic else [])
+                methods = scenario.get('methods') or default_methods
+                unknown = [method for method in methods if method not in BATCH_METHODS]
+                if unknown:
+                    raise ValueError(f'unknown methods {unknown}')
+
+                rates = None
+                if DEMOGRAPHIC in methods:
+                    if not demographic:
+                        raise ValueError('demographic rates are required for the Demographic method')
+                    # Rates come per 10000 people, as in the Demographic endpoint
+                    rates = tuple(float(demographic[key]) / 10000 for key in
+                                  ('birthRate', 'deathRate', 'emigrationRate', 'immigrationRate'))
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                return Response({'error': f'Invalid scenario {i}: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+            names.append(scenario.get('name') or f'scenario_{i + 1}')
+            parsed.append({'years': years, 'methods': methods, 'rates': rates})
+
+        # Villages are resolved (and their subDistrictId corrected) once for all scenarios
+        villages, subdistrict, error = requested_villages(request)
+        if error is not None:
+            return error
+        if not len(villages):
+            return Response({'error': 'villages_props must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = batch_projection(
+                base_year, as_village_arrays(villages), get_growth_parameters(), parsed,
+                subdistricts=requested_subdistrict_codes(subdistrict), exact=exact, memo=get_projection_memo(),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({'error': f'Invalid villages_props: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result['scenarios'] = names
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class BacktestAPI(APIView):
+    """
+    Backtest of the time series methods: each fitted on 1951-2001 and scored
+    against the 2011 census, with the best method per subdistrict.
+    POST {"subdistrict_props": [...]} limits the rows to those subdistricts.
+    """
+    def post(self, request, format=None):
+        subdistrict = request.data.get('subdistrict_props')
+        if subdistrict is not None and not isinstance(subdistrict, list):
+            return Response({'error': 'subdistrict_props must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        backtest = get_backtest(get_growth_parameters())
+        codes = requested_subdistrict_codes(subdistrict) if subdistrict else None
+        return Response({'methods': list(PROJECTION_METHODS), 'subdistricts': backtest.rows(codes)},
+                        status=status.HTTP_200_OK)
+
+
+class UncertaintyAPI(APIView):
+    """
+    Monte Carlo percentile bands of the time series projections. Each sample
+    bootstraps a method's parameters from the census history of every
+    subdistrict: the decadal increases (Arithmetic, Incremental), the decadal
+    growth percentages (Geometric) or the residuals of the log-linear fit
+    (Exponential).
+
+    POST {selection | villages_props + subdistrict_props, year | start_year + end_year,
+          methods (default all four), samples (default 2000), percentiles (default [5, 50, 95]), seed}
+    returns {"point": {method: totals}, "bands": {method: {"p5": {year: total}, ...}}, "samples": n}
+    """
+    def post(self, request, format=None):
+        base_year = 2011
+        try:
+            years = requested_years(request.data.get('year'), request.data.get('start_year'), request.data.get('end_year'))
+            if not years or len(years) > MAX_BATCH_YEARS:
+                raise ValueError(f'year or a start_year..end_year range of at most {MAX_BATCH_YEARS} years is required')
+            methods = request.data.get('methods') or list(UNCERTAINTY_METHODS)
+            unknown = [method for method in methods if method not in UNCERTAINTY_METHODS]
+            if unknown:
+                raise ValueError(f'no uncertainty bands for {unknown}; available: {list(UNCERTAINTY_METHODS)}')
+            samples = int(request.data.get('samples', DEFAULT_SAMPLES))
+            if not 1 <= samples <= MAX_SAMPLES:
+                raise ValueError(f'samples must be between 1 and {MAX_SAMPLES}')
+            percentiles = [float(p) for p in request.data.get('percentiles') or DEFAULT_PERCENTILES]
+            if any(not 0 <= p <= 100 for p in percentiles):
+                raise ValueError('percentiles must be between 0 and 100')
+            seed = request.data.get('seed')
+            seed = int(seed) if seed is not None else None
+        except (TypeError, ValueError) as e:
+            return Response({'error': f'Invalid uncertainty request: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        villages, subdistrict, error = requested_villages(request)
+        if error is not None:
+            return error
+        villages = as_village_arrays(villages)
+        parameters = get_growth_parameters()
+        subdistricts = requested_subdistrict_codes(subdistrict)
+
+        output = {'point': {}, 'bands': {}, 'samples': samples}
+        for method in methods:
+            output['point'][method] = method_totals(
+                method, base_year, years, villages, parameters, subdistricts, memo=get_projection_memo()
+            )
+            output['bands'][method] = uncertainty_bands(
+                method, base_year, years, villages, parameters, subdistricts,
+                samples=samples, percentiles=percentiles, seed=seed,
+            )
+        return Response(output, status=status.HTTP_200_OK)
+
+
+class ProjectionExportAPI(APIView):
+    """
+    Streams per-village projections as rows of village_code, subdistrict, method,
+    year, value in NDJSON, CSV or Parquet. Villages are projected in chunks while
+    the response is sent, so memory does not grow with the selection.
+
+    POST {selection | villages_props + subdistrict_props, year | start_year + end_year,
+          methods (default the four time series methods), demographic (rates per 10000),
+          format: ndjson | csv | parquet}
+    """
+    def post(self, request, format=None):
+        base_year = 2011
+        export_format = request.data.get('format', 'ndjson')
+        if export_format not in export_formats():
+            return Response({'error': f'format must be one of {export_formats()}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            years = requested_years(request.data.get('year'), request.data.get('start_year'), request.data.get('end_year'))
+            if not years or len(years) > MAX_BATCH_YEARS:
+                raise ValueError(f'year or a start_year..end_year range of at most {MAX_BATCH_YEARS} years is required')
+            demographic = request.data.get('demographic')
+            methods = request.data.get('methods') or list(PROJECTION_METHODS)
+            unknown = [method for method in methods if method not in BATCH_METHODS]
+            if unknown:
+                raise ValueError(f'unknown methods {unknown}')
+            rates = None
+            if DEMOGRAPHIC in methods:
+                if not demographic:
+                    raise ValueError('demographic rates are required for the Demographic method')
+                rates = tuple(float(demographic[key]) / 10000 for key in
+                              ('birthRate', 'deathRate', 'emigrationRate', 'immigrationRate'))
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({'error': f'Invalid export request: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        villages, subdistrict, error = requested_villages(request)
+        if error is not None:
+            return error
+        villages = as_village_arrays(villages)
+        if (village_codes(villages.ids) < 0).any():
+            return Response({'error': 'every village needs a numeric village code'}, status=status.HTTP_400_BAD_REQUEST)
+        # Checked here: once streaming has started, an error can only truncate the download
+        try:
+            subdistrict_codes = np.asarray(villages.subdistrict_codes, dtype=np.int64)
+            population_ok = np.isfinite(np.asarray(villages.population, dtype=np.float64)).all()
+        except (TypeError, ValueError):
+            subdistrict_codes, population_ok = None, False
+        if not population_ok:
+            return Response({'error': 'every village needs a numeric population and subDistrictId'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        villages = VillageArrays.from_columns(villages.ids, villages.population, subdistrict_codes.tolist())
+
+        logger.info(f"Exporting {len(villages)} villages x {len(years)} years ({', '.join(methods)}) as {export_format}")
+        frames = projection_frames(
+            base_year, years, villages, get_growth_parameters(), methods,
+            subdistricts=requested_subdistrict_codes(subdistrict), rates=rates,
+        )
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream_export(export_format, frames), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="population_projection.{extension}"'
+        return response
+
+
 class SewageCalculation(APIView):
     """
     Calculate sewage generation using either the water supply approach
@@ -606,7 +967,7 @@ class CohortView(APIView):
         Requires either single_year or both start_year and end_year
         """
         # Get data from request
-        print('request_data is cohort by anas ', request.data)
+        print('request_data is cohort by anas ', request_summary(request))
         
         # Extract parameters from request
         single_year = request.data.get('year')
@@ -616,16 +977,27 @@ class CohortView(APIView):
         subdistrict = request.data.get('subdistrict_props', {})
         district = request.data.get('district_props', {})
         state = request.data.get('state_props', {})
+        selection = None
+        if request.data.get('selection'):
+            selection = get_selection(request.data['selection'])
+            if selection is None:
+                return Response({'error': 'Unknown or expired selection handle'}, status=status.HTTP_404_NOT_FOUND)
         
         # Check if required year parameters are provided
         if not (single_year or (start_year and end_year)):
             error_msg = "Either 'year' or both 'start_year' and 'end_year' must be provided"
             print(error_msg)
             return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fertility, survival and migration schedules for years projected past the stored cohorts
+        try:
+            schedules = CohortSchedules.from_request(request.data.get('schedules'))
+        except (TypeError, ValueError) as e:
+            return Response({"error": f"Invalid schedules: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         
         # Debug the input parameters
         print(f"Filtering parameters: single_year={single_year}, start_year={start_year}, end_year={end_year}")
-        print(f"Location filters: villages={villages}, subdistrict={subdistrict}, district={district}, state={state}")
+        print(f"Location filters: villages={len(villages)} items, subdistrict={subdistrict}, district={district}, state={state}")
         
         # Build location filter - apply available filters
         location_filter = Q()
@@ -652,8 +1024,17 @@ class CohortView(APIView):
         if villages and len(villages) > 0:
             village_ids = [int(village['id']) for village in villages if village.get('id')]
             if village_ids:
-                print(f"Adding villages filter: {village_ids}")
+                print(f"Adding villages filter: {len(village_ids)} villages")
                 location_filter &= Q(village_code__in=village_ids)
+
+        # Apply a registered selection; whole subdistricts are filtered by subdistrict code
+        if selection is not None:
+            if selection.from_subdistricts:
+                print(f"Adding selection filter: {len(selection.requested_subdistricts)} subdistricts")
+                location_filter &= Q(subdistrict_code__in=selection.requested_subdistricts)
+            else:
+                print(f"Adding selection filter: {len(selection)} villages")
+                location_filter &= Q(village_code__in=selection.village_codes())
         
         # Ensure at least one location filter is applied
         if location_filter == Q():
@@ -661,153 +1042,112 @@ class CohortView(APIView):
             print(error_msg)
             return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Initialize result
-        main_output = {}
-        
-        if single_year:
-            # Handle single year query
-            try:
+        # Determine years to query; the single-year view always includes 2011
+        try:
+            if single_year:
                 year_value = int(single_year)
-                print(f"Querying for year: {year_value}")
-                
-                # Determine years to query
-                years_to_query = [year_value]
-                if year_value != 2011:
-                    years_to_query.append(2011)
-                
-                years_data = []
-                for year in years_to_query:
-                    # Add year filter
-                    query_filter = location_filter & Q(year=year)
-                    
-                    # Get cohort data for the specified year and location
-                    cohort_data = PopulationCohort.objects.filter(query_filter)
-                    count = cohort_data.count()
-                    print(f"Found {count} records for year {year}")
-                    
-                    if count > 0:
-                        # Process the data
-                        result = self.organize_cohort_data(cohort_data)
-                        
-                        years_data.append({
-                            'year': year,
-                            'data': result
-                        })
-                    else:
-                        years_data.append({
-                            'year': year,
-                            'data': {}
-                        })
-                
-                # Sort years with 2011 first if it's included
-                years_data.sort(key=lambda x: (x['year'] != 2011, x['year']))
-                
-                main_output['cohort'] = years_data
-                
-            except ValueError:
-                error_msg = f"Invalid year format: {single_year}"
-                print(error_msg)
-                return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
-                
-        elif start_year and end_year:
-            # Handle year range query
-            try:
+                years_to_query = [year_value] if year_value == 2011 else [2011, year_value]
+            else:
                 start = int(start_year)
                 end = int(end_year)
-                
                 if start > end:
                     error_msg = f"start_year ({start}) cannot be greater than end_year ({end})"
                     print(error_msg)
                     return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                print(f"Querying for years from {start} to {end}")
-                
-                # Determine years to query
+                # 2011 comes first when it is outside the range
                 years_to_query = list(range(start, end + 1))
                 if 2011 not in years_to_query:
-                    years_to_query.append(2011)
-                
-                # Sort years with 2011 first if not in original range
-                if 2011 not in range(start, end + 1):
-                    years_to_query.sort(key=lambda x: (x != 2011, x))
-                else:
-                    years_to_query.sort()
-                
-                years_data = []
-                
-                for year in years_to_query:
-                    # Add year filter
-                    query_filter = location_filter & Q(year=year)
-                    
-                    # Get cohort data for the current year and location
-                    cohort_data = PopulationCohort.objects.filter(query_filter)
-                    count = cohort_data.count()
-                    print(f"Found {count} records for year {year}")
-                    
-                    if count > 0:  # Only add years with data
-                        # Process the data
-                        result = self.organize_cohort_data(cohort_data)
-                        
-                        years_data.append({
-                            'year': year,
-                            'data': result
-                        })
-                
-                main_output['cohort'] = years_data
-            except ValueError:
+                    years_to_query.insert(0, 2011)
+        except ValueError:
+            if single_year:
+                error_msg = f"Invalid year format: {single_year}"
+            else:
                 error_msg = f"Invalid year format: start_year={start_year}, end_year={end_year}"
-                print(error_msg)
-                return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
-        
-        print("Final output:", main_output)   
-        return Response(main_output, status=status.HTTP_200_OK)
+            print(error_msg)
+            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One grouped query over every requested year
+        rows = (
+            PopulationCohort.objects.filter(location_filter & Q(year__in=years_to_query))
+            .values('year', 'age_group', 'gender')
+            .annotate(total=Sum('population'))
+            .order_by('year', 'age_group', 'gender')
+        )
+        stored = self.organize_cohort_data(rows)
+        print(f"Found cohort data for {len(stored)} of {len(years_to_query)} years")
+
+        missing = [year for year in years_to_query if year not in stored]
+        projected, error = self.projected_cohorts(location_filter, missing, schedules) if missing else ({}, None)
+        if error is not None:
+            return error
+
+        years_data = []
+        for year in years_to_query:
+            if year in stored:
+                years_data.append({'year': year, 'data': stored[year]})
+            elif year in projected:
+                years_data.append({'year': year, 'data': projected[year], 'projected': True})
+            elif single_year:
+                # A single-year request lists years without data as empty; a range leaves them out
+                years_data.append({'year': year, 'data': {}})
+
+        return Response({'cohort': years_data}, status=status.HTTP_200_OK)
+
+
+    def projected_cohorts(self, location_filter, years, schedules):
+        """
+        Age pyramids of the requested years without stored cohorts, projected from the
+        latest stored year before each of them. Returns (projected, error_response).
+        """
+        stored = sorted(PopulationCohort.objects.filter(location_filter).values_list('year', flat=True).distinct())
+        bases = {}
+        for year in years:
+            earlier = [stored_year for stored_year in stored if stored_year < year]
+            if year not in stored and earlier:
+                bases.setdefault(earlier[-1], []).append(year)
+
+        projected = {}
+        try:
+            for base_year, targets in bases.items():
+                logger.debug(f"Projecting cohorts for {targets} from {base_year}")
+                records = PopulationCohort.objects.filter(location_filter & Q(year=base_year)).values_list(
+                    'village_code', 'age_group', 'gender', 'population'
+                )
+                projected.update(cohort_pyramids(records.iterator(), base_year, targets, schedules))
+        except (TypeError, ValueError) as e:
+            return None, Response({"error": f"Cannot project cohorts: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return projected, None
     
-    def organize_cohort_data(self, queryset):
+    def organize_cohort_data(self, rows):
         """
-        Organizes cohort data by age group and gender
-        Input: queryset of PopulationCohort objects
-        Output: Structured data by age group and gender
+        Organizes cohort data by year, age group and gender in one pass
+        Input: rows of year, age_group, gender and their summed population ("total")
+        Output: {year: structured data by age group and gender, with a "total" category}
         """
-        # Initialize the result dictionary
-        result = {}
-        
-        # Track totals
-        total_male = 0
-        total_female = 0
-        total_overall = 0
-        
-        # Process each record
-        for record in queryset:
-            age_group = record.age_group
-            gender = record.gender.lower()  # Normalize gender to lowercase
-            population = record.population
-            
-            # Initialize age group data if not present
-            if age_group not in result:
-                result[age_group] = {'male': 0, 'female': 0, 'total': 0}
-            
+        output = {}
+        totals = {}
+
+        for row in rows:
+            year = row['year']
+            age_group = row['age_group']
+            gender = row['gender'].lower()  # Normalize gender to lowercase
+            population = row['total'] or 0
+
+            result = output.setdefault(year, {})
+            year_total = totals.setdefault(year, {'male': 0, 'female': 0, 'total': 0})
+            group = result.setdefault(age_group, {'male': 0, 'female': 0, 'total': 0})
+
             # Update gender-specific count
-            if gender == 'male':
-                result[age_group]['male'] += population
-                total_male += population
-            elif gender == 'female':
-                result[age_group]['female'] += population
-                total_female += population
-            
-            # Update total for this age group
-            result[age_group]['total'] = result[age_group]['male'] + result[age_group]['female']
-            total_overall += population
-        
+            if gender in ('male', 'female'):
+                group[gender] += population
+                year_total[gender] += population
+                group['total'] = group['male'] + group['female']
+            year_total['total'] += population
+
         # Add a "total" category with sums across all age groups
-        if result:
-            result['total'] = {
-                'male': total_male,
-                'female': total_female,
-                'total': total_overall
-            }
-        
-        print(f"Organized data: {result}")
-        return result
+        for year, result in output.items():
+            result['total'] = totals[year]
+        return output
 #end cohort logic here 
 
 
@@ -815,6 +1155,22 @@ class CohortView(APIView):
 #Below logic for to get shapefile of selected state in basic module 
 #these api used only in basic module 
 
+def filtered_layer_response(request, shapefile_full_path, level=0):
+    """
+    Answers optional bbox=minx,miny,maxx,maxy and where={json} parameters from the
+    layer's STRtree and attribute arrays. Returns None when neither is given, so
+    the caller serves the whole layer from the byte cache instead.
+    """
+    try:
+        bbox, where = requested_feature_filter(request.query_params)
+        if bbox is None and where is None:
+            return None
+        # Viewport results vary with every pan, so they are serialized but not cached
+        return geojson_response(request, select_features(shapefile_full_path, bbox, where, level))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class DefaultBaseMapAPI(APIView):
     def get(self, request, *args, **kwargs):
         try:
@@ -825,13 +1181,20 @@ class DefaultBaseMapAPI(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'Shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
+            # Optional zoom/tolerance picks a pre-simplified level of detail
+            try:
+                level = requested_lod_level(request.query_params)
+            except ValueError:
+                return Response({'error': 'zoom and tolerance must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Convert to GeoJSON
-            geojson_data = json.loads(gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            response = filtered_layer_response(request, shapefile_full_path, level)
+            if response is not None:
+                return response
+
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(
+                request, shapefile_full_path, {'lod': level}, lambda: load_layer_lod(shapefile_full_path, level)
+            )
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -852,6 +1215,12 @@ class StateShapefileAPI(APIView):
         # Convert to string if it's not already
         original_state_code = str(state_code)
         
+        # Optional zoom/tolerance picks a pre-simplified level of detail
+        try:
+            level = requested_lod_level(request.data, request.query_params)
+        except ValueError:
+            return Response({"error": "zoom and tolerance must be numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Path to the state shapefile
         shapefile_path = os.path.join(settings.MEDIA_ROOT, 'basic_shape', 'B_State')
         
@@ -865,49 +1234,29 @@ class StateShapefileAPI(APIView):
             )
         
         try:
-            # Read the shapefile using geopandas
+            # Read the shapefile from the shared layer cache
             shapefile_full_path = os.path.join(shapefile_path, 'B_State.shp')
             print(f"Attempting to read shapefile from: {shapefile_full_path}")
             
-            gdf = gpd.read_file(shapefile_full_path)
-            print(f"Shapefile loaded. Columns: {gdf.columns.tolist()}")
-            
-            # Try different formats of state code
-            # First, try the original input
-            state_data = gdf[gdf['state_code'] == original_state_code]
-            
-            # If not found, try with zero padding (if it's a number)
-            if state_data.empty and original_state_code.isdigit():
-                padded_state_code = original_state_code.zfill(2)  # Pad with leading zero if needed
-                print(f"No results for '{original_state_code}', trying padded code: '{padded_state_code}'")
-                state_data = gdf[gdf['state_code'] == padded_state_code]
-            
-            # If still not found, try without padding (if it has leading zeros)
-            if state_data.empty and original_state_code.startswith('0'):
-                unpadded_state_code = original_state_code.lstrip('0')
-                if unpadded_state_code == '':  # Edge case: input was just '0'
-                    unpadded_state_code = '0'
-                print(f"No results for '{original_state_code}', trying unpadded code: '{unpadded_state_code}'")
-                state_data = gdf[gdf['state_code'] == unpadded_state_code]
-            
-            print(f"Filtered data for state_code. Found {len(state_data)} records.")
-            
-            if state_data.empty:
+            # Canonical codes make '09', '9' and 9 equivalent, replacing the padded/unpadded retries
+            state_key = canonical_code(original_state_code)
+
+            def build():
+                _, code_index = load_layer_with_index(shapefile_full_path, ['state_code'])
+                positions, _ = code_index.lookup([state_key])
+                if len(positions) == 0:
+                    return None
+                return load_layer_lod(shapefile_full_path, level).take(positions)
+
+            params = {'state_code': state_key, 'lod': level}
+            response = cached_geojson_response(request, shapefile_full_path, params, build)
+            if response is None:
                 print(f"No data found for any format of state_code: {original_state_code}")
                 return Response(
                     {"error": f"No data found for state_code {original_state_code}"},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            
-            # Convert to GeoJSON format
-            geojson_data = json.loads(state_data.to_json())
-            
-            # Print information about the found state
-            print(f"State boundary found for: {state_data['State'].values[0]}")
-            print(f"GeoJSON type: {geojson_data['type']}")
-            print(f"Number of features: {len(geojson_data['features'])}")
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            return response
         
         except Exception as e:
             import traceback
@@ -939,6 +1288,12 @@ class MultipleDistrictsAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Optional zoom/tolerance picks a pre-simplified level of detail
+        try:
+            level = requested_lod_level(request.data, request.query_params)
+        except ValueError:
+            return Response({"error": "zoom and tolerance must be numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Path to the district shapefile
         shapefile_path = os.path.join(settings.MEDIA_ROOT, 'basic_shape', 'B_district')
         
@@ -952,90 +1307,38 @@ class MultipleDistrictsAPI(APIView):
             )
         
         try:
-            # Read the shapefile using geopandas
+            # Read the shapefile and its (state, district) code index from the shared layer cache
             shapefile_full_path = os.path.join(shapefile_path, 'B_district.shp')
-            print(f"Attempting to read shapefile from: {shapefile_full_path}")
-            
-            gdf = gpd.read_file(shapefile_full_path)
-            print(f"Shapefile loaded. Columns: {gdf.columns.tolist()}")
-            
-            # Ensure all code columns are strings for consistent comparison
-            gdf['STATE_CODE'] = gdf['STATE_CODE'].astype(str)
-            gdf['DISTRICT_C'] = gdf['DISTRICT_C'].astype(str)
-            
-            # Initialize a list to store matching rows instead of an empty GeoDataFrame
-            matched_rows = []
+            gdf, code_index = load_layer_with_index(shapefile_full_path, ['STATE_CODE', 'DISTRICT_C'])
             
+            # Canonical codes make '09', '9' and 9 equivalent, replacing the padded/unpadded retries
+            requested = []
             for district_entry in districts_data:
-                state_code = str(district_entry.get('state_code', '')).upper()  # Convert to uppercase
-                district_c = str(district_entry.get('district_c', '')).upper()  # Convert to uppercase
+                state_code = str(district_entry.get('state_code', '')).upper()
+                district_c = str(district_entry.get('district_c', '')).upper()
                 
                 if not state_code or not district_c:
                     print(f"Skipping entry missing state_code or district_c: {district_entry}")
                     continue
-                
-                # Try with original codes
-                district_match = gdf[(gdf['STATE_CODE'] == state_code) & 
-                                    (gdf['DISTRICT_C'] == district_c)]
-                
-                # Try with padded codes if needed
-                if district_match.empty:
-                    if state_code.isdigit():
-                        padded_state = state_code.zfill(2)
-                        district_match = gdf[(gdf['STATE_CODE'] == padded_state) & 
-                                           (gdf['DISTRICT_C'] == district_c)]
-                    
-                    if district_match.empty and district_c.isdigit():
-                        padded_district = district_c.zfill(2)
-                        district_match = gdf[(gdf['STATE_CODE'] == state_code) & 
-                                           (gdf['DISTRICT_C'] == padded_district)]
-                    
-                    if district_match.empty and state_code.isdigit() and district_c.isdigit():
-                        padded_state = state_code.zfill(2)
-                        padded_district = district_c.zfill(2)
-                        district_match = gdf[(gdf['STATE_CODE'] == padded_state) & 
-                                           (gdf['DISTRICT_C'] == padded_district)]
-                
-                # Try with unpadded codes if needed
-                if district_match.empty:
-                    if state_code.startswith('0'):
-                        unpadded_state = state_code.lstrip('0') or '0'
-                        district_match = gdf[(gdf['STATE_CODE'] == unpadded_state) & 
-                                           (gdf['DISTRICT_C'] == district_c)]
-                    
-                    if district_match.empty and district_c.startswith('0'):
-                        unpadded_district = district_c.lstrip('0') or '0'
-                        district_match = gdf[(gdf['STATE_CODE'] == state_code) & 
-                                           (gdf['DISTRICT_C'] == unpadded_district)]
-                    
-                    if district_match.empty and state_code.startswith('0') and district_c.startswith('0'):
-                        unpadded_state = state_code.lstrip('0') or '0'
-                        unpadded_district = district_c.lstrip('0') or '0'
-                        district_match = gdf[(gdf['STATE_CODE'] == unpadded_state) & 
-                                           (gdf['DISTRICT_C'] == unpadded_district)]
-                
-                if not district_match.empty:
-                    # Append the matched rows to our list
-                    matched_rows.append(district_match)
-                    print(f"Found match for state_code: {state_code}, district_c: {district_c}")
-                else:
-                    print(f"No match found for state_code: {state_code}, district_c: {district_c}")
+                requested.append(code_index.make_key(state_code, district_c))
+            
+            positions, missing = code_index.lookup(requested)
+            not_found = [{'state_code': str(s), 'district_c': str(d)} for s, d in missing]
             
-            if not matched_rows:
+            if len(positions) == 0:
                 print("No matching districts found.")
                 return Response(
-                    {"error": "No matching districts found for the provided criteria."},
+                    {"error": "No matching districts found for the provided criteria.", "not_found": not_found},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Concatenate all matched rows into a single GeoDataFrame
-            matched_districts = pd.concat(matched_rows, ignore_index=True)
+            matched_districts = load_layer_lod(shapefile_full_path, level).take(positions).reset_index(drop=True)
             
             # Convert to GeoJSON format
             geojson_data = json.loads(matched_districts.to_json())
+            geojson_data['not_found'] = not_found
             
-            print(f"Total districts found: {len(matched_districts)}")
-            print(f"GeoJSON features: {len(geojson_data['features'])}")
+            print(f"Total districts found: {len(matched_districts)}, not found: {len(not_found)}")
             
             return Response(geojson_data, status=status.HTTP_200_OK)
         
@@ -1074,64 +1377,35 @@ class MultipleSubdistrictsAPI(APIView):
             )
         
         try:
-            # Read the shapefile using geopandas
+            # Read the shapefile and its subdistrict code index from the shared layer cache
             shapefile_full_path = os.path.join(shapefile_path, 'B_subdistrict.shp')
-            print(f"Attempting to read shapefile from: {shapefile_full_path}")
-            
-            gdf = gpd.read_file(shapefile_full_path)
-            print(f"Shapefile loaded. Columns: {gdf.columns.tolist()}")
-            
-            # Ensure subdistrict code column is string for consistent comparison
-            gdf['SUBDIS_COD'] = gdf['SUBDIS_COD'].astype(str)
-            
-            # Initialize a list to store matching rows
-            matched_rows = []
+            gdf, code_index = load_layer_with_index(shapefile_full_path, ['SUBDIS_COD'])
             
+            requested = []
             for subdistrict_entry in subdistricts_data:
-                subdis_cod = str(subdistrict_entry.get('subdis_cod', '')).upper()  # Convert to uppercase
+                subdis_cod = str(subdistrict_entry.get('subdis_cod', '')).upper()
                 
                 if not subdis_cod:
                     print(f"Skipping entry missing subdistrict code: {subdistrict_entry}")
                     continue
-                
-                # Try with original code
-                subdistrict_match = gdf[gdf['SUBDIS_COD'] == subdis_cod]
-                
-                # Try with padded code if needed
-                if subdistrict_match.empty and subdis_cod.isdigit():
-                    padded_subdis = subdis_cod.zfill(4)
-                    subdistrict_match = gdf[gdf['SUBDIS_COD'] == padded_subdis]
-                
-                # Try with unpadded code if needed
-                if subdistrict_match.empty:
-                    unpadded_subdis = subdis_cod.lstrip('0') or '0' if subdis_cod.startswith('0') else subdis_cod
-                    subdistrict_match = gdf[gdf['SUBDIS_COD'] == unpadded_subdis]
-                
-                if not subdistrict_match.empty:
-                    # Append the matched rows to our list
-                    matched_rows.append(subdistrict_match)
-                    print(f"Found match anas for subdis_cod: {subdis_cod}")
-                else:
-                    print(f"No match found anas for subdis_cod: {subdis_cod}")
+                requested.append(code_index.make_key(subdis_cod))
+            
+            positions, missing = code_index.lookup(requested)
+            not_found = [str(code) for code in missing]
             
-            if not matched_rows:
+            if len(positions) == 0:
                 print("No matching subdistricts found.")
                 return Response(
-                    {"error": "No matching subdistricts found for the provided criteria."},
+                    {"error": "No matching subdistricts found for the provided criteria.", "not_found": not_found},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Import pandas explicitly to avoid the 'pd is not defined' error
-            import pandas as pd
-            
-            # Concatenate all matched rows into a single GeoDataFrame
-            matched_subdistricts = gpd.GeoDataFrame(pd.concat(matched_rows, ignore_index=True))
-            matched_subdistricts = matched_subdistricts.to_crs(epsg=4326)
+            matched_subdistricts = gdf.take(positions).reset_index(drop=True)
             # Convert to GeoJSON format
             geojson_data = json.loads(matched_subdistricts.to_json())
+            geojson_data['not_found'] = not_found
             
-            print(f"Total subdistricts found: {len(matched_subdistricts)}")
-            print(f"GeoJSON features: {len(geojson_data['features'])}")
+            print(f"Total subdistricts found: {len(matched_subdistricts)}, not found: {len(not_found)}")
             
             return Response(geojson_data, status=status.HTTP_200_OK)
         
@@ -1148,7 +1422,7 @@ class MultipleVillagesAPI(APIView):
     def post(self, request, format=None):
         villages_data = request.data.get('villages')
         
-        print(f"Received request with villages data: {villages_data}")
+        print(f"Received request with {len(villages_data) if isinstance(villages_data, list) else 0} villages")
         
         if not villages_data or not isinstance(villages_data, list):
             return Response(
@@ -1169,73 +1443,35 @@ class MultipleVillagesAPI(APIView):
             )
         
         try:
-            # Read the shapefile using geopandas
+            # Read the shapefile and its shapeID index from the shared layer cache
             shapefile_full_path = os.path.join(shapefile_path, 'basin_village.shp')
-            print(f"Attempting to read shapefile from: {shapefile_full_path}")
-            
-            gdf = gpd.read_file(shapefile_full_path)
-            print(f"Shapefile loaded. Columns: {gdf.columns.tolist()}")
-            
-            # Ensure shapeID column is string for consistent comparison
-            gdf['shapeID'] = gdf['shapeID'].astype(str)
-            
-            # Initialize a list to store matching rows
-            matched_rows = []
+            gdf, code_index = load_layer_with_index(shapefile_full_path, ['shapeID'])
             
+            requested = []
             for village_entry in villages_data:
-                shape_id = str(village_entry.get('shape_id', '')).upper()  # Convert to uppercase
+                shape_id = str(village_entry.get('shape_id', '')).upper()
                 
                 if not shape_id:
                     print(f"Skipping entry missing shape_id: {village_entry}")
                     continue
-                
-                # Try with original shape ID
-                village_match = gdf[gdf['shapeID'] == shape_id]
-                
-                # Try with padded shape ID if needed and if it's a number
-                if village_match.empty and shape_id.isdigit():
-                    # Try different padding lengths (2, 3, 4, 6 digits)
-                    for pad_length in [2, 3, 4, 6]:
-                        padded_shape_id = shape_id.zfill(pad_length)
-                        village_match = gdf[gdf['shapeID'] == padded_shape_id]
-                        if not village_match.empty:
-                            break
-                
-                # Try with unpadded shape ID if needed
-                if village_match.empty and shape_id.startswith('0'):
-                    unpadded_shape_id = shape_id.lstrip('0') or '0' if shape_id == '0' else shape_id.lstrip('0')
-                    village_match = gdf[gdf['shapeID'] == unpadded_shape_id]
-                
-                if not village_match.empty:
-                    # Append the matched rows to our list
-                    matched_rows.append(village_match)
-                    print(f"Found match for shape_id: {shape_id}")
-                else:
-                    print(f"No match found for shape_id: {shape_id}")
+                requested.append(code_index.make_key(shape_id))
+            
+            positions, missing = code_index.lookup(requested)
+            not_found = [str(code) for code in missing]
             
-            if not matched_rows:
+            if len(positions) == 0:
                 print("No matching villages found.")
                 return Response(
-                    {"error": "No matching villages found for the provided criteria."},
+                    {"error": "No matching villages found for the provided criteria.", "not_found": not_found},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Import pandas explicitly to avoid the 'pd is not defined' error
-            import pandas as pd
-            
-            # Concatenate all matched rows into a single GeoDataFrame
-            matched_villages = gpd.GeoDataFrame(pd.concat(matched_rows, ignore_index=True))
-            matched_villages = matched_villages.to_crs(epsg=4326)
+            matched_villages = gdf.take(positions).reset_index(drop=True)
             # Convert to GeoJSON format
             geojson_data = json.loads(matched_villages.to_json())
+            geojson_data['not_found'] = not_found
             
-            # Print information about the found villages
-            if 'Village' in matched_villages.columns:
-                villages_found = matched_villages['Village'].tolist()
-                print(f"Villages found: {villages_found}")
-            
-            print(f"Total villages found: {len(matched_villages)}")
-            print(f"GeoJSON features: {len(geojson_data['features'])}")
+            print(f"Total villages found: {len(matched_villages)}, not found: {len(not_found)}")
             
             return Response(geojson_data, status=status.HTTP_200_OK)
         
@@ -1261,13 +1497,12 @@ class BasinAPI(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'River shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            # Convert to GeoJSON
-            geojson_data = json.loads(gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            response = filtered_layer_response(request, shapefile_full_path)
+            if response is not None:
+                return response
+
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(request, shapefile_full_path, {}, lambda: load_layer(shapefile_full_path))
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)  
@@ -1285,13 +1520,12 @@ class RiverMapAPI(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'River shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            # Convert to GeoJSON
-            geojson_data = json.loads(gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            response = filtered_layer_response(request, shapefile_full_path)
+            if response is not None:
+                return response
+
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(request, shapefile_full_path, {}, lambda: load_layer(shapefile_full_path))
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)        
@@ -1311,21 +1545,18 @@ class RiverStretched(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'Stretches shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            # Filter data based on River_Code if provided
-            if river_code:
-                filtered_gdf = gdf[gdf['River_Code'] == river_code]
-                if filtered_gdf.empty:
-                    return Response({'error': f'No data found for River_Code: {river_code}'}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                filtered_gdf = gdf  # Return all stretches if no River_Code
-            
-            # Convert to GeoJSON
-            geojson_data = json.loads(filtered_gdf.to_json())
-            print(f"GeoJSON features: {len(geojson_data['features'])}")
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            def build():
+                gdf = load_layer(shapefile_full_path)
+                # Filter data based on River_Code if provided
+                if river_code:
+                    filtered_gdf = gdf[gdf['River_Code'] == river_code]
+                    return None if filtered_gdf.empty else filtered_gdf
+                return gdf  # Return all stretches if no River_Code
+
+            response = cached_geojson_response(request, shapefile_full_path, {'River_Code': river_code}, build)
+            if response is None:
+                return Response({'error': f'No data found for River_Code: {river_code}'}, status=status.HTTP_404_NOT_FOUND)
+            return response
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)      
@@ -1345,25 +1576,24 @@ class Drain(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'Drains shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            
-            # Filter data based on Stretch_IDs if provided
-            if stretch_ids:
-                # Convert to list if a single ID is provided
-                if not isinstance(stretch_ids, list):
-                    stretch_ids = [stretch_ids]
-                filtered_gdf = gdf[gdf['Stretch_ID'].isin(stretch_ids)]
-                if filtered_gdf.empty:
-                    return Response({'error': f'No data found for the provided Stretch_IDs'}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                filtered_gdf = gdf  # Return all drains if no Stretch_ID
-            
-            # Convert to GeoJSON
-            geojson_data = json.loads(filtered_gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            # Convert to list if a single ID is provided
+            if stretch_ids and not isinstance(stretch_ids, list):
+                stretch_ids = [stretch_ids]
+
+            def build():
+                gdf = load_layer(shapefile_full_path)
+                # Filter data based on Stretch_IDs if provided
+                if stretch_ids:
+                    filtered_gdf = gdf[gdf['Stretch_ID'].isin(stretch_ids)]
+                    return None if filtered_gdf.empty else filtered_gdf
+                return gdf  # Return all drains if no Stretch_ID
+
+            # isin() keeps layer order, so the ID order does not change the response
+            params = {'Stretch_ID': sorted(stretch_ids or [], key=str)}
+            response = cached_geojson_response(request, shapefile_full_path, params, build)
+            if response is None:
+                return Response({'error': f'No data found for the provided Stretch_IDs'}, status=status.HTTP_404_NOT_FOUND)
+            return response
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1386,25 +1616,24 @@ class Catchments(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'Catchments shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
             
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            
-            # Filter data based on Drain_No if provided
-            if drain_nos:
-                # Convert to list if a single ID is provided
-                if not isinstance(drain_nos, list):
-                    drain_nos = [drain_nos]
-                filtered_gdf = gdf[gdf['Drain_No'].isin(drain_nos)]
-                if filtered_gdf.empty:
-                    return Response({'error': f'No catchment data found for the provided Drain_No'}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                filtered_gdf = gdf  # Return all catchments if no Drain_No are provided
-            
-            # Convert to GeoJSON
-            geojson_data = json.loads(filtered_gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            # Convert to list if a single ID is provided
+            if drain_nos and not isinstance(drain_nos, list):
+                drain_nos = [drain_nos]
+
+            def build():
+                gdf = load_layer(shapefile_full_path)
+                # Filter data based on Drain_No if provided
+                if drain_nos:
+                    filtered_gdf = gdf[gdf['Drain_No'].isin(drain_nos)]
+                    return None if filtered_gdf.empty else filtered_gdf
+                return gdf  # Return all catchments if no Drain_No are provided
+
+            # isin() keeps layer order, so the Drain_No order does not change the response
+            params = {'Drain_No': sorted(drain_nos or [], key=str)}
+            response = cached_geojson_response(request, shapefile_full_path, params, build)
+            if response is None:
+                return Response({'error': f'No catchment data found for the provided Drain_No'}, status=status.HTTP_404_NOT_FOUND)
+            return response
         
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1420,21 +1649,46 @@ class AllStretches(APIView):
             if not os.path.exists(shapefile_full_path):
                 return Response({'error': 'Stretches shapefile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Read shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_full_path)
-            gdf = gdf.to_crs("EPSG:4326")
-            
-            # Convert to GeoJSON
-            geojson_data = json.loads(gdf.to_json())
-            
-            return Response(geojson_data, status=status.HTTP_200_OK)
+            response = filtered_layer_response(request, shapefile_full_path)
+            if response is not None:
+                return response
+
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(request, shapefile_full_path, {}, lambda: load_layer(shapefile_full_path))
 
         except Exception as e: 
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+#Mapbox vector tiles for the Basic, Drain and mapplot layers: /tiles/<layer>/<z>/<x>/<y>.mvt
+class VectorTileAPI(APIView):
+    def get(self, request, layer, z, x, y, format=None):
+        if tiles.mapbox_vector_tile is None:
+            return Response({'error': 'Vector tiles require the mapbox-vector-tile package.'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        if layer not in tiles.TILE_LAYERS:
+            return Response({'error': f'Unknown tile layer: {layer}'}, status=status.HTTP_404_NOT_FOUND)
+        if z > tiles.MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return Response({'error': f'Invalid tile {z}/{x}/{y}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            tile = tiles.get_tile(layer, z, x, y)
+        except FileNotFoundError:
+            return Response({'error': f'Shapefile for layer {layer} not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error rendering tile {layer}/{z}/{x}/{y}: {str(e)}", exc_info=True)
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
 
 
+#Hit/miss counters of the shared shapefile layer cache and the GeoJSON byte cache
+class LayerCacheStatsAPI(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'layers': get_layer_cache().stats(),
+            'geojson': get_geojson_cache().stats(),
+            'projections': get_projection_memo().stats(),
+        }, status=status.HTTP_200_OK)
+
 
 class VillagesCatchmentIntersection(APIView):
     def post(self, request, *args, **kwargs):
@@ -1450,8 +1704,8 @@ class VillagesCatchmentIntersection(APIView):
                 drain_nos = [drain_nos]
             
             # Construct paths to shapefiles
-            catchment_path = os.path.join(settings.MEDIA_ROOT, 'Drain_shp', 'Catchments', 'Catchment.shp')
-            village_path = os.path.join(settings.MEDIA_ROOT, 'Drain_shp', 'Villages', 'basin_village.shp')
+            catchment_path = catchment_layer_path()
+            village_path = village_layer_path()
             
             if not os.path.exists(catchment_path) or not os.path.exists(village_path):
                 return Response(
@@ -1459,16 +1713,13 @@ class VillagesCatchmentIntersection(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Read shapefiles
-            catchment_gdf = gpd.read_file(catchment_path)
-            village_gdf = gpd.read_file(village_path)
-            
-            # Ensure both are in the same CRS
-            catchment_gdf = catchment_gdf.to_crs("EPSG:4326")
-            village_gdf = village_gdf.to_crs("EPSG:4326")
+            # Read shapefiles from the shared layer cache (both already in EPSG:4326)
+            catchment_gdf = load_layer(catchment_path)
+            village_gdf = load_layer(village_path)
             
             # Filter catchments for selected drains
-            filtered_catchment = catchment_gdf[catchment_gdf['Drain_No'].isin(drain_nos)]
+            catchment_mask = catchment_gdf['Drain_No'].isin(drain_nos)
+            filtered_catchment = catchment_gdf[catchment_mask]
             
             if filtered_catchment.empty:
                 return Response(
@@ -1476,26 +1727,25 @@ class VillagesCatchmentIntersection(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Find intersections between catchments and villages
-            intersected_villages = []
-            intersected_village_gdf = gpd.GeoDataFrame()
+            # Intersecting pairs in catchment order, then village order within each catchment;
+            # looked up in the precomputed membership table, or one bulk STRtree query without it
+            catchment_pos, village_pos = intersecting_pairs(catchment_gdf, np.flatnonzero(catchment_mask.to_numpy()))
             
-            for idx, catchment in filtered_catchment.iterrows():
-                catchment_geom = catchment.geometry
-                drain_no = catchment['Drain_No']
-                
-                for vidx, village in village_gdf.iterrows():
-                    if catchment_geom.intersects(village.geometry):
-                        village_data = {
-                            'shapeID': village.get('shapeID', 'Unknown'),
-                            'shapeName': village.get('shapeName', 'Unknown'),
-                            'drainNo': drain_no
-                        }
-                        intersected_villages.append(village_data)
-                        intersected_village_gdf = pd.concat(
-                            [intersected_village_gdf, village_gdf.loc[[vidx]]],
-                            ignore_index=True
-                        )
+            def village_values(column):
+                if column not in village_gdf.columns:
+                    return ['Unknown'] * len(village_pos)
+                return village_gdf[column].take(village_pos).tolist()
+            
+            drain_values = catchment_gdf['Drain_No'].take(catchment_pos).tolist()
+            intersected_villages = [
+                {'shapeID': shape_id, 'shapeName': shape_name, 'drainNo': drain_no}
+                for shape_id, shape_name, drain_no in zip(
+                    village_values('shapeID'), village_values('shapeName'), drain_values
+                )
+            ]
+            
+            # One village row per intersecting pair, taken in a single step
+            intersected_village_gdf = village_gdf.take(village_pos).reset_index(drop=True)
             
             # Remove duplicates based on shapeID
             intersected_village_gdf = intersected_village_gdf.drop_duplicates(subset=['shapeID'])
@@ -1532,11 +1782,97 @@ class VillagesCatchmentIntersection(APIView):
 
 
 
+#Population of each drain catchment, counting every village by the share of its area inside the catchment
+class CatchmentPopulationAPI(APIView):
+    def post(self, request, *args, **kwargs):
+        try:
+            drain_nos = request.data.get('Drain_No', [])
+            
+            if not drain_nos:
+                return Response({'error': 'Drain_No is required'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Convert to list if a single ID is provided
+            if not isinstance(drain_nos, list):
+                drain_nos = [drain_nos]
+            
+            catchment_path = catchment_layer_path()
+            village_path = village_layer_path()
+            
+            if not os.path.exists(catchment_path) or not os.path.exists(village_path):
+                return Response(
+                    {'error': 'One or more required shapefiles not found'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            def build():
+                catchment_gdf = load_layer(catchment_path)
+                catchment_mask = catchment_gdf['Drain_No'].isin(drain_nos)
+                if not catchment_mask.any():
+                    return None
+                
+                overlaps = catchment_overlaps(catchment_gdf, np.flatnonzero(catchment_mask.to_numpy()))
+                
+                # One IN query for every village touching the selected catchments
+                shape_ids = list(dict.fromkeys(overlaps['shapeID'].tolist()))
+                results, missing_ids = bulk_village_lookup(shape_ids)
+                population_by_id = {result['village_code']: result['total_population'] or 0 for result in results}
+                
+                village_population = np.array(
+                    [population_by_id.get(str(shape_id), 0) for shape_id in overlaps['shapeID'].tolist()], dtype=float
+                )
+                weighted_population = village_population * overlaps['village_fraction'].to_numpy()
+                
+                # Plain Python values for the JSON encoder
+                drain_values = overlaps['Drain_No'].tolist()
+                shape_values = overlaps['shapeID'].tolist()
+                
+                drains = []
+                for rows in overlaps.groupby('Drain_No', sort=False).indices.values():
+                    drains.append({
+                        'Drain_No': drain_values[rows[0]],
+                        'population': round(float(weighted_population[rows].sum()), 2),
+                        'village_count': len(rows),
+                        'villages': [
+                            {
+                                'shapeID': shape_id,
+                                'population_2011': int(population),
+                                'fraction': round(float(fraction), 6),
+                                'weighted_population': round(float(weighted), 2),
+                            }
+                            for shape_id, population, fraction, weighted in zip(
+                                [shape_values[row] for row in rows], village_population[rows],
+                                overlaps['village_fraction'].to_numpy()[rows], weighted_population[rows],
+                            )
+                        ],
+                    })
+                
+                return {
+                    'drains': drains,
+                    'total_population': round(float(weighted_population.sum()), 2),
+                    'missing_villages': [str(village_id) for village_id in missing_ids],
+                }
+            
+            # Cached per drain set, layer version and Basic_village version; the drain order does not change the result
+            params = {'catchment_population': sorted(drain_nos, key=str), 'villages': village_data_version()}
+            response = cached_geojson_response(request, [catchment_path, village_path], params, build)
+            if response is None:
+                return Response(
+                    {'error': f'No catchment data found for the provided Drain_No'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return response
+        
+        except Exception as e:
+            print(f"Error in catchment population: {str(e)}")
+            print(traceback.format_exc())
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class VillagePopulationAPI(APIView):
     def post(self, request, format=None):
         try:
             shape_ids = request.data.get('shapeID', [])
-            print(f"Received shapeIDs: {shape_ids}")
+            print(f"Received {len(shape_ids) if isinstance(shape_ids, list) else 0} shapeIDs")
 
             if not shape_ids or not isinstance(shape_ids, list):
                 return Response(
@@ -1544,59 +1880,10 @@ class VillagePopulationAPI(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            results = []
-
-            for village_id in shape_ids:
-                # Generate possible formats for matching village_code
-                possible_ids = list({
-                    str(village_id),
-                    str(int(village_id)) if str(village_id).isdigit() else str(village_id),
-                    str(village_id).lstrip('0'),
-                    str(village_id).zfill(6) if str(village_id).isdigit() else str(village_id)
-                })
-
-                print(f"Trying possible IDs for {village_id}: {possible_ids}")
-
-                village_found = False
-                for possible_id in possible_ids:
-                    try:
-                        village_qs = Basic_village.objects.filter(village_code=possible_id)
-                        if village_qs.exists():
-                            village_record = village_qs.first()
-                            village_found = True
-
-                            # Get population directly from Basic_village model
-                            # This is where the fix is - use population_2011 from Basic_village
-                            total_pop = village_record.population_2011  
-
-                            print(f"Found village {possible_id} with population {total_pop}")
-
-                            results.append({
-                                'village_code': str(village_id),  # Keep original ID in response
-                                'subdistrict_code': str(village_record.subdistrict_code_id),
-                                'district_code': str(village_record.subdistrict_code.district_code_id) if hasattr(village_record.subdistrict_code, 'district_code_id') else None,
-                                'state_code': str(village_record.subdistrict_code.district_code.state_code_id) if hasattr(village_record.subdistrict_code, 'district_code') and hasattr(village_record.subdistrict_code.district_code, 'state_code_id') else None,
-                                'total_population': total_pop
-                            })
-                            break  # Stop trying more formats
-                    except Exception as e:
-                        print(f"Error trying ID {possible_id}: {str(e)}")
-                        continue
-
-                if not village_found:
-                    print(f"No match found for village {village_id}")
-                    # For villages not found, use the fallback approach with a random population
-                    # This ensures we have data for visualization while debugging
-                    # import random
-                    # fallback_pop = random.randint(1000, 5000)
-                    
-                    # results.append({
-                    #     'village_code': str(village_id),
-                    #     'subdistrict_code': None,
-                    #     'district_code': None,
-                    #     'state_code': None,
-                    #     'total_population': fallback_pop
-                    # })
+            # One IN query over the canonical codes, joined through the hierarchy
+            results, missing_ids = bulk_village_lookup(shape_ids)
+            if missing_ids:
+                print(f"No match found for {len(missing_ids)} villages")
 
             print(f"Returning population data for {len(results)} villages")
             return Response(results, status=status.HTTP_200_OK)
@@ -1615,10 +1902,14 @@ class VillagePopulationAPI(APIView):
 
 
 class VillagePopulationRawSQL(APIView):
+    """
+    Same lookup as VillagePopulationAPI, but villages that are not found are
+    returned with a zero population instead of being left out.
+    """
     def post(self, request, format=None):
         try:
             shape_ids = request.data.get('shapeID', [])
-            print(f"Received shapeIDs for raw SQL: {shape_ids}")
+            print(f"Received {len(shape_ids) if isinstance(shape_ids, list) else 0} shapeIDs for bulk lookup")
             
             if not shape_ids or not isinstance(shape_ids, list):
                 return Response(
@@ -1626,51 +1917,24 @@ class VillagePopulationRawSQL(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Use raw SQL to join Basic_village with Population_2011
-            with connection.cursor() as cursor:
-                # Create placeholders for SQL IN clause
-                placeholders = ', '.join(['%s'] * len(shape_ids))
-                
-                # SQL query to join the two tables
-                query = f"""
-                    SELECT 
-                        bv.village_code,
-                        bv.subdistrict_code,
-                        bv.district_code,
-                        bv.state_code,
-                        SUM(p.population) as total_population
-                    FROM 
-                        Basic_village bv
-                    LEFT JOIN 
-                        Population_2011 p ON bv.village_code = p.village_code
-                    WHERE 
-                        bv.village_code IN ({placeholders})
-                    GROUP BY 
-                        bv.village_code, bv.subdistrict_code, bv.district_code, bv.state_code
-                """
-                
-                cursor.execute(query, shape_ids)
-                columns = [col[0] for col in cursor.description]
-                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
-                # Add entries for villages not found
-                found_village_codes = [str(result['village_code']) for result in results]
-                for village_id in shape_ids:
-                    if str(village_id) not in found_village_codes:
-                        results.append({
-                            'village_code': str(village_id),
-                            'subdistrict_code': None,
-                            'district_code': None,
-                            'state_code': None,
-                            'total_population': 0
-                        })
+            results, missing_ids = bulk_village_lookup(shape_ids)
+            
+            # Add entries for villages not found
+            for village_id in missing_ids:
+                results.append({
+                    'village_code': str(village_id),
+                    'subdistrict_code': None,
+                    'district_code': None,
+                    'state_code': None,
+                    'total_population': 0
+                })
                 
-            print(f"SQL found {len(results)} villages")
+            print(f"Bulk lookup found {len(shape_ids) - len(missing_ids)} villages")
             return Response(results, status=status.HTTP_200_OK)
         
         except Exception as e:
             import traceback
-            print(f"Error in raw SQL: {str(e)}")
+            print(f"Error in bulk village lookup: {str(e)}")
             print(traceback.format_exc())
             return Response(
                 {"error": str(e)},
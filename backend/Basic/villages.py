@@ -0,0 +1,157 @@
+import threading
+import logging
+
+import numpy as np
+
+from .models import Basic_village
+from .layer_index import canonical_code
+
+logger = logging.getLogger(__name__)
+
+
+def village_code_key(village_id):
+    """Canonical integer village code for an ID coming from a shapefile or the frontend, or None"""
+    code = canonical_code(village_id)
+    return code if isinstance(code, int) else None
+
+
+def village_codes(village_ids):
+    """Integer village code of each ID (any padding) as an int64 array, -1 where it is not a code"""
+    try:
+        raw = np.asarray(village_ids)
+        if raw.dtype.kind not in 'iuU':
+            raise ValueError
+        codes = raw.astype(np.int64)
+        if len(codes) and codes.min() < 0:
+            raise ValueError
+        return codes
+    except (TypeError, ValueError, OverflowError):
+        keys = (village_code_key(village_id) for village_id in village_ids)
+        return np.fromiter((-1 if key is None else key for key in keys), dtype=np.int64, count=len(village_ids))
+
+
+def bulk_village_lookup(village_ids):
+    """
+    Resolves village IDs in any padding ('000123', '123', 123) with a single
+    IN query that joins the subdistrict/district hierarchy.
+
+    Returns (results, missing_ids). results follows the request order and keeps
+    each original ID as 'village_code'.
+    """
+    codes = {village_code_key(village_id) for village_id in village_ids}
+    codes.discard(None)
+
+    rows = Basic_village.objects.filter(village_code__in=codes).values_list(
+        'village_code',
+        'population_2011',
+        'subdistrict_code_id',
+        'subdistrict_code__district_code_id',
+        'subdistrict_code__district_code__state_code_id',
+    )
+    found = {row[0]: row for row in rows}
+
+    results = []
+    missing_ids = []
+    for village_id in village_ids:
+        row = found.get(village_code_key(village_id))
+        if row is None:
+            missing_ids.append(village_id)
+            continue
+        _, population, subdistrict_code, district_code, state_code = row
+        results.append({
+            'village_code': str(village_id),  # Keep original ID in response
+            'subdistrict_code': str(subdistrict_code),
+            'district_code': str(district_code),
+            'state_code': str(state_code),
+            'total_population': population,
+        })
+    return results, missing_ids
+
+
+class VillageSubdistrictMap:
+    """
+    Every village code with its subdistrict code, as two sorted int64 arrays.
+    Lookups are a binary search per requested village.
+    """
+
+    def __init__(self, rows):
+        rows = np.asarray(rows, dtype=[('village_code', np.int64), ('subdistrict_code', np.int64)])
+        rows.sort(order='village_code')
+        self.village_codes = rows['village_code']
+        self.subdistrict_codes = rows['subdistrict_code']
+
+    def __len__(self):
+        return len(self.village_codes)
+
+    @property
+    def nbytes(self):
+        return self.village_codes.nbytes + self.subdistrict_codes.nbytes
+
+    def resolve(self, village_ids):
+        """Subdistrict code of each village ID (any padding), or None when it is unknown"""
+        keys = [village_code_key(village_id) for village_id in village_ids]
+        if not len(self.village_codes):
+            return [None] * len(keys)
+        lookup = np.array([-1 if key is None else key for key in keys], dtype=np.int64)
+        positions = np.searchsorted(self.village_codes, lookup).clip(max=len(self.village_codes) - 1)
+        found = self.village_codes[positions] == lookup
+        subdistricts = self.subdistrict_codes[positions]
+        return [int(code) if hit else None for code, hit in zip(subdistricts.tolist(), found.tolist())]
+
+
+_village_map = None
+_village_map_lock = threading.Lock()
+
+
+def get_village_subdistricts():
+    """
+    The resident VillageSubdistrictMap, loaded from Basic_village on first use and
+    kept until a village is saved or deleted (see signals.py).
+    """
+    global _village_map
+    village_map = _village_map
+    if village_map is None:
+        with _village_map_lock:
+            if _village_map is None:
+                rows = Basic_village.objects.values_list('village_code', 'subdistrict_code_id')
+                _village_map = VillageSubdistrictMap(np.fromiter(
+                    rows.iterator(chunk_size=20000),
+                    dtype=[('village_code', np.int64), ('subdistrict_code', np.int64)],
+                ))
+                logger.info(f"Loaded village/subdistrict map ({len(_village_map)} villages)")
+            village_map = _village_map
+    return village_map
+
+
+def invalidate_village_subdistricts():
+    """Drops the resident map; the next lookup reloads it"""
+    global _village_map
+    with _village_map_lock:
+        _village_map = None
+
+
+# Bumped on every Basic_village save or delete (see signals.py); cached responses
+# built from village rows put it in their key so edits are not served stale
+_village_data_version = 0
+
+
+def village_data_version():
+    """Version of the Basic_village rows as seen by this process"""
+    return _village_data_version
+
+
+def bump_village_data_version():
+    global _village_data_version
+    with _village_map_lock:
+        _village_data_version += 1
+
+
+def correct_village_subdistricts(villages):
+    """
+    Replaces each village's subDistrictId with the one recorded in Basic_village,
+    leaving villages that are not in the table unchanged.
+    """
+    subdistricts = get_village_subdistricts().resolve([village['id'] for village in villages])
+    for village, subdistrict_code in zip(villages, subdistricts):
+        if subdistrict_code is not None:
+            village['subDistrictId'] = subdistrict_code
@@ -17,6 +17,8 @@ import uuid
 import tempfile
 import matplotlib.path
 from pykrige.ok import OrdinaryKriging
+from Basic.layer_cache import load_layer
+from Basic.geojson_cache import cached_geojson_response
 
 
 
@@ -37,8 +39,9 @@ class BasinBoundaryAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Read the shapefile using GeoPandas
-            gdf = gpd.read_file(shapefile_path)
+            # Read the shapefile from the shared layer cache; invalid geometries are
+            # fixed and the layer reprojected to EPSG:4326 once, when it is loaded
+            gdf = load_layer(shapefile_path, repair=True)
             
             if gdf.empty:
                 return Response(
@@ -46,30 +49,8 @@ class BasinBoundaryAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Check for invalid geometries
-            if not gdf.geometry.is_valid.all():
-                print("Invalid geometries found, attempting to fix...")
-                gdf.geometry = gdf.geometry.buffer(0)  # Attempt to fix invalid geometries
-            
-            # Ensure CRS is EPSG:4326 (standard for GeoJSON)
-            if gdf.crs and gdf.crs != "EPSG:4326":
-                gdf = gdf.to_crs("EPSG:4326")
-            
-            # Convert to GeoJSON
-            geojson = gdf.to_json()
-            
-            # Parse and validate GeoJSON to catch issues
-            try:
-                parsed_geojson = json.loads(geojson)
-                if parsed_geojson.get("type") != "FeatureCollection":
-                    raise ValueError("Generated GeoJSON is not a FeatureCollection")
-            except json.JSONDecodeError as e:
-                return Response(
-                    {'error': 'Failed to generate valid GeoJSON', 'detail': str(e)},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            return Response(parsed_geojson, status=status.HTTP_200_OK)
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(request, shapefile_path, {'repair': True}, lambda: gdf)
             
         except Exception as e:
             import traceback
@@ -113,7 +94,9 @@ class WellGeoJSONAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            gdf = gpd.read_file(shapefile_path)
+            # Invalid geometries are fixed and the layer reprojected to EPSG:4326
+            # once, when the shared layer cache loads it
+            gdf = load_layer(shapefile_path, repair=True)
             
             if gdf.empty:
                 return Response(
@@ -121,30 +104,8 @@ class WellGeoJSONAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Check for invalid geometries
-            if not gdf.geometry.is_valid.all():
-                print("Invalid geometries found, attempting to fix...")
-                gdf.geometry = gdf.geometry.buffer(0)  # Attempt to fix invalid geometries
-            
-            # Ensure CRS is EPSG:4326 (standard for GeoJSON)
-            if gdf.crs and gdf.crs != "EPSG:4326":
-                gdf = gdf.to_crs("EPSG:4326")
-            
-            # Convert to GeoJSON
-            geojson = gdf.to_json()
-            
-            # Parse and validate GeoJSON to catch issues
-            try:
-                parsed_geojson = json.loads(geojson)
-                if parsed_geojson.get("type") != "FeatureCollection":
-                    raise ValueError("Generated GeoJSON is not a FeatureCollection")
-            except json.JSONDecodeError as e:
-                return Response(
-                    {'error': 'Failed to generate valid GeoJSON', 'detail': str(e)},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-            
-            return Response(parsed_geojson, status=status.HTTP_200_OK)
+            # Static layer: serve the pre-serialized, pre-compressed GeoJSON bytes
+            return cached_geojson_response(request, shapefile_path, {'repair': True}, lambda: gdf)
             
         except Exception as e:
             import traceback
@@ -133,9 +133,36 @@ CORS_ALLOWED_ORIGINS = [
 # Optional: Allow credentials (cookies, etc.) if needed
 CORS_ALLOW_CREDENTIALS = True
 
+# Token of a kept projection result (Basic/projection_results.py), readable by the frontend
+CORS_EXPOSE_HEADERS = ['X-Result-Token']
+
 
 
 
 # Media files (User uploaded files)
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-MEDIA_URL = '/DSS_Anas/media/'
\ No newline at end of file
+MEDIA_URL = '/DSS_Anas/media/'
+
+# Memory budget (bytes) for the process-wide shapefile layer cache in Basic/layer_cache.py
+LAYER_CACHE_MAX_BYTES = int(os.environ.get('LAYER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Memory budget (bytes) for pre-serialized/compressed GeoJSON responses in Basic/geojson_cache.py
+GEOJSON_CACHE_MAX_BYTES = int(os.environ.get('GEOJSON_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Memory budget (bytes, 0 disables) and year horizon of memoized per-village projections in Basic/projection_memo.py
+PROJECTION_MEMO_MAX_BYTES = int(os.environ.get('PROJECTION_MEMO_MAX_BYTES', 0))
+PROJECTION_MEMO_HORIZON = int(os.environ.get('PROJECTION_MEMO_HORIZON', 90))
+
+# Worker processes for large Monte Carlo uncertainty simulations in Basic/uncertainty.py (0 runs them in-process)
+PROJECTION_UNCERTAINTY_WORKERS = int(os.environ.get('PROJECTION_UNCERTAINTY_WORKERS', 0))
+
+# Seconds a registered village selection handle (Basic/selections.py) stays valid after its last use,
+# and a kept projection result token (Basic/projection_results.py) after it was issued;
+# handles live in the default Django cache, so multi-process deployments need a shared cache backend
+SELECTION_HANDLE_TTL = int(os.environ.get('SELECTION_HANDLE_TTL', 60 * 60))
+
+# GeoParquet copies of the media shapefiles, written by `python manage.py ingest_layers`
+LAYER_STORE_ROOT = os.path.join(MEDIA_ROOT, 'layer_store')
+
+# On-disk Mapbox vector tile cache, one directory per layer version
+TILE_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'tile_cache')
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+
+# Layers served by get_shapefile_data, relative to MEDIA_ROOT, by category and subcategory
+SHAPEFILE_PATHS = {
+    'india': {
+        'all': os.path.join('shapefile', 'india', 'india.shp')
+    },
+    
+    'administrative': {
+        'district': os.path.join('shapefile', 'Administrative', 'District', 'Districts.shp'),
+        'villages': os.path.join('shapefile', 'Administrative', 'Villages', 'Villages_PCS.shp')
+    },
+    'watershed': {
+        'varuna': os.path.join('shapefile', 'Watershed', 'Varuna', 'Varuna_Watershed.shp'),
+        'basuhi': os.path.join('shapefile', 'Watershed', 'Basuhi', 'Basuhi_Watershed.shp'),
+        'morwa': os.path.join('shapefile', 'Watershed', 'Morwa', 'Morwa_Watershed.shp'),
+        'all': os.path.join('shapefile', 'Watershed', 'All', 'Watershed.shp')
+    },
+    'drains': {
+        'varuna': os.path.join('shapefile', 'DrainsOutlet', 'Varuna_Drain', 'Varuna_Drain.shp'),
+        'basuhi': os.path.join('shapefile', 'DrainsOutlet', 'Basuhi_Drain', 'Basuhi_Drain.shp'),
+        'morwa': os.path.join('shapefile', 'DrainsOutlet', 'Morwa_Drain', 'Morwa_Drain.shp')
+    },
+    'canals': {
+        'all': os.path.join('shapefile', 'Canals', 'Canals.shp')
+    },
+    'household': {
+        'All': os.path.join('shapefile', 'Households', 'All', 'Households.shp'),
+        'Bhadohi': os.path.join('shapefile', 'Households', 'Bhadohi','Bhadohi', 'Households_Bhadohi.shp'),
+        'Jaunpur': os.path.join('shapefile', 'Households', 'Jaunpur', 'Jaunpur', 'Households_Jaunpur.shp'),
+        'Pratapgarh': os.path.join('shapefile', 'Households', 'Pratapgarh', 'Pratapgarh', 'Households_Pratapgarh.shp'),
+        'Prayajraj': os.path.join('shapefile', 'Households', 'Prayajraj', 'Prayajraj', 'Households_Prayagraj.shp'),
+        'Varanasi': os.path.join('shapefile', 'Households', 'Varanasi', 'Varanasi', 'Households_varanasi.shp')
+    },
+    'railways': {
+        'all': os.path.join('shapefile', 'Railways', 'Railways.shp')
+    },
+    'industries': {
+        'all': os.path.join('shapefile', 'Industries', 'Industries.shp')
+    },
+    'rivers': {
+        'varuna': os.path.join('shapefile', 'Rivers', 'Varuna', 'Varuna_River.shp'),
+        'basuhi': os.path.join('shapefile', 'Rivers', 'Basuhi', 'Basuhi_River.shp'),
+        'morwa': os.path.join('shapefile', 'Rivers', 'Morwa', 'Morwa_River.shp')
+    },
+    'roads': {
+        'all': os.path.join('shapefile', 'Roads', 'Roads.shp')
+    },
+    'stps': {
+        'all': os.path.join('shapefile', 'STPs', 'STP.shp')
+    }
+}
@@ -19,6 +19,10 @@ import tempfile
 import os
 import json
 from shapely.ops import unary_union
+from Basic.layer_lod import load_layer_lod, requested_lod_level
+from .layers import SHAPEFILE_PATHS
+from Basic.geojson_cache import cached_geojson_response, geojson_response
+from Basic.layer_query import load_layer_query, requested_feature_filter
 
 
 logger = logging.getLogger(__name__)
@@ -42,55 +46,7 @@ def get_shapefile_data(request):
         
         logger.info(f"Requested category: {category}, subcategory: {subcategory}")
 
-        shapefile_paths = {
-            'india': {
-                'all': os.path.join('shapefile', 'india', 'india.shp')
-            },
-            
-            'administrative': {
-                'district': os.path.join('shapefile', 'Administrative', 'District', 'Districts.shp'),
-                'villages': os.path.join('shapefile', 'Administrative', 'Villages', 'Villages_PCS.shp')
-            },
-            'watershed': {
-                'varuna': os.path.join('shapefile', 'Watershed', 'Varuna', 'Varuna_Watershed.shp'),
-                'basuhi': os.path.join('shapefile', 'Watershed', 'Basuhi', 'Basuhi_Watershed.shp'),
-                'morwa': os.path.join('shapefile', 'Watershed', 'Morwa', 'Morwa_Watershed.shp'),
-                'all': os.path.join('shapefile', 'Watershed', 'All', 'Watershed.shp')
-            },
-            'drains': {
-                'varuna': os.path.join('shapefile', 'DrainsOutlet', 'Varuna_Drain', 'Varuna_Drain.shp'),
-                'basuhi': os.path.join('shapefile', 'DrainsOutlet', 'Basuhi_Drain', 'Basuhi_Drain.shp'),
-                'morwa': os.path.join('shapefile', 'DrainsOutlet', 'Morwa_Drain', 'Morwa_Drain.shp')
-            },
-            'canals': {
-                'all': os.path.join('shapefile', 'Canals', 'Canals.shp')
-            },
-            'household': {
-                'All': os.path.join('shapefile', 'Households', 'All', 'Households.shp'),
-                'Bhadohi': os.path.join('shapefile', 'Households', 'Bhadohi','Bhadohi', 'Households_Bhadohi.shp'),
-                'Jaunpur': os.path.join('shapefile', 'Households', 'Jaunpur', 'Jaunpur', 'Households_Jaunpur.shp'),
-                'Pratapgarh': os.path.join('shapefile', 'Households', 'Pratapgarh', 'Pratapgarh', 'Households_Pratapgarh.shp'),
-                'Prayajraj': os.path.join('shapefile', 'Households', 'Prayajraj', 'Prayajraj', 'Households_Prayagraj.shp'),
-                'Varanasi': os.path.join('shapefile', 'Households', 'Varanasi', 'Varanasi', 'Households_varanasi.shp')
-            },
-            'railways': {
-                'all': os.path.join('shapefile', 'Railways', 'Railways.shp')
-            },
-            'industries': {
-                'all': os.path.join('shapefile', 'Industries', 'Industries.shp')
-            },
-            'rivers': {
-                'varuna': os.path.join('shapefile', 'Rivers', 'Varuna', 'Varuna_River.shp'),
-                'basuhi': os.path.join('shapefile', 'Rivers', 'Basuhi', 'Basuhi_River.shp'),
-                'morwa': os.path.join('shapefile', 'Rivers', 'Morwa', 'Morwa_River.shp')
-            },
-            'roads': {
-                'all': os.path.join('shapefile', 'Roads', 'Roads.shp')
-            },
-            'stps': {
-                'all': os.path.join('shapefile', 'STPs', 'STP.shp')
-            }
-        }
+        shapefile_paths = SHAPEFILE_PATHS
 
 # Check if category or subcategory is empty, set defaults
         if not category or not subcategory:
@@ -117,172 +73,191 @@ def get_shapefile_data(request):
                     'error': f'Shapefile not found: {shapefile_paths[category][subcategory]}'
                 }, status=404)
             
-            logger.info(f"Reading shapefile from: {shapefile_path}")
+            # Optional zoom/tolerance picks a pre-simplified level of detail (e.g. for india at national zoom)
+            try:
+                level = requested_lod_level(request.GET)
+            except ValueError:
+                return JsonResponse({'error': 'zoom and tolerance must be numbers'}, status=400)
 
-            # Read the shapefile
-            gdf = gpd.read_file(shapefile_path)
-            
-            # Add this to see coordinates in your console
-            # print("Sample of coordinates:")
-            # for idx, row in gdf.head().iterrows():
-            #  print(f"Feature {idx} coordinates:")
-            # print(row.geometry)
-            
-            # Convert to WGS84 if needed
-            if gdf.crs and gdf.crs != 'EPSG:4326':
-                logger.info("Converting CRS to EPSG:4326")
-             
-                gdf = gdf.to_crs('EPSG:4326')
-#               gdf_web = gdf.to_crs('EPSG:3857')
-            features = []
-            for idx, row in gdf.iterrows():
-                try:
-                    geometry = row.geometry
-                    if geometry is None or geometry.is_empty:
-                        continue
+            # Optional bbox/where restrict the output to the features in the current viewport
+            positions = None
+            try:
+                bbox, where = requested_feature_filter(request.GET)
+                if bbox is not None or where is not None:
+                    _, query_index = load_layer_query(shapefile_path)
+                    positions = query_index.select(bbox, where)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
+            # Features are built once per layer version and served from the
+            # pre-serialized, pre-compressed GeoJSON byte cache afterwards
+            def build():
+                logger.info(f"Reading shapefile from: {shapefile_path}")
+
+                # Read the layer through the shared layer cache; it prefers the GeoParquet
+                # copy from `manage.py ingest_layers` and is already in WGS84
+                gdf = load_layer_lod(shapefile_path, level)
+                if positions is not None:
+                    gdf = gdf.take(positions)
+
+                features = []
+                for idx, row in gdf.iterrows():
+                    try:
+                        geometry = row.geometry
+                        if geometry is None or geometry.is_empty:
+                            continue
                     
-                    properties = row.drop('geometry').to_dict()
+                        properties = row.drop('geometry').to_dict()
                     
-                    # Process different geometry types
-                    if geometry.geom_type == 'Polygon':
-                        coords = []
-                        exterior_coords = geometry.exterior.coords.xy
-                        for x, y in zip(exterior_coords[0], exterior_coords[1]):
-                            coords.append([float(x), float(y)])
-                        
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'Polygon',
-                                'coordinates': [coords]
-                            },
-                            'properties': properties
-                        })
-                    
-                    elif geometry.geom_type == 'MultiPolygon':
-                        multi_coords = []
-                        for polygon in geometry.geoms:
+                        # Process different geometry types
+                        if geometry.geom_type == 'Polygon':
                             coords = []
-                            exterior_coords = polygon.exterior.coords.xy
+                            exterior_coords = geometry.exterior.coords.xy
                             for x, y in zip(exterior_coords[0], exterior_coords[1]):
                                 coords.append([float(x), float(y)])
-                            multi_coords.append(coords)
-                            
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'MultiPolygon',
-                                'coordinates': [multi_coords]
-                            },
-                            'properties': properties
-                        })
+                        
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'Polygon',
+                                    'coordinates': [coords]
+                                },
+                                'properties': properties
+                            })
                     
-                    elif geometry.geom_type == 'LineString':
-                        coords = []
-                        line_coords = geometry.coords.xy
-                        for x, y in zip(line_coords[0], line_coords[1]):
-                            coords.append([float(x), float(y)])
+                        elif geometry.geom_type == 'MultiPolygon':
+                            multi_coords = []
+                            for polygon in geometry.geoms:
+                                coords = []
+                                exterior_coords = polygon.exterior.coords.xy
+                                for x, y in zip(exterior_coords[0], exterior_coords[1]):
+                                    coords.append([float(x), float(y)])
+                                multi_coords.append(coords)
                             
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'LineString',
-                                'coordinates': coords
-                            },
-                            'properties': properties
-                        })
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'MultiPolygon',
+                                    'coordinates': [multi_coords]
+                                },
+                                'properties': properties
+                            })
                     
-                    elif geometry.geom_type == 'MultiLineString':
-                        multi_coords = []
-                        for line in geometry.geoms:
+                        elif geometry.geom_type == 'LineString':
                             coords = []
-                            line_coords = line.coords.xy
+                            line_coords = geometry.coords.xy
                             for x, y in zip(line_coords[0], line_coords[1]):
                                 coords.append([float(x), float(y)])
-                            multi_coords.append(coords)
                             
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'MultiLineString',
-                                'coordinates': multi_coords
-                            },
-                            'properties': properties
-                        })
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'LineString',
+                                    'coordinates': coords
+                                },
+                                'properties': properties
+                            })
+                    
+                        elif geometry.geom_type == 'MultiLineString':
+                            multi_coords = []
+                            for line in geometry.geoms:
+                                coords = []
+                                line_coords = line.coords.xy
+                                for x, y in zip(line_coords[0], line_coords[1]):
+                                    coords.append([float(x), float(y)])
+                                multi_coords.append(coords)
+                            
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'MultiLineString',
+                                    'coordinates': multi_coords
+                                },
+                                'properties': properties
+                            })
                     
-                    elif geometry.geom_type == 'Point':
-                        x, y = geometry.x, geometry.y
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'Point',
-                                'coordinates': [float(x), float(y)]
-                            },
-                            'properties': properties
-                        })
+                        elif geometry.geom_type == 'Point':
+                            x, y = geometry.x, geometry.y
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'Point',
+                                    'coordinates': [float(x), float(y)]
+                                },
+                                'properties': properties
+                            })
                     
-                    elif geometry.geom_type == 'MultiPoint':
-                        multi_coords = []
-                        for point in geometry.geoms:
-                            x, y = point.x, point.y
-                            multi_coords.append([float(x), float(y)])
+                        elif geometry.geom_type == 'MultiPoint':
+                            multi_coords = []
+                            for point in geometry.geoms:
+                                x, y = point.x, point.y
+                                multi_coords.append([float(x), float(y)])
                             
-                        features.append({
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'MultiPoint',
-                                'coordinates': multi_coords
-                            },
-                            'properties': properties
-                        })
+                            features.append({
+                                'type': 'Feature',
+                                'geometry': {
+                                    'type': 'MultiPoint',
+                                    'coordinates': multi_coords
+                                },
+                                'properties': properties
+                            })
                     
-                    # Additional handling for complex Polygon geometries
-                    elif geometry.geom_type == 'GeometryCollection':
-                        for subgeom in geometry.geoms:
-                            if subgeom.geom_type == 'Polygon':
-                                coords = []
-                                exterior_coords = subgeom.exterior.coords.xy
-                                for x, y in zip(exterior_coords[0], exterior_coords[1]):
-                                    coords.append([float(x), float(y)])
+                        # Additional handling for complex Polygon geometries
+                        elif geometry.geom_type == 'GeometryCollection':
+                            for subgeom in geometry.geoms:
+                                if subgeom.geom_type == 'Polygon':
+                                    coords = []
+                                    exterior_coords = subgeom.exterior.coords.xy
+                                    for x, y in zip(exterior_coords[0], exterior_coords[1]):
+                                        coords.append([float(x), float(y)])
                                 
-                                features.append({
-                                    'type': 'Feature',
-                                    'geometry': {
-                                        'type': 'Polygon',
-                                        'coordinates': [coords]
-                                    },
-                                    'properties': properties
-                                })
+                                    features.append({
+                                        'type': 'Feature',
+                                        'geometry': {
+                                            'type': 'Polygon',
+                                            'coordinates': [coords]
+                                        },
+                                        'properties': properties
+                                    })
                             
-                            elif subgeom.geom_type == 'Point':
-                                x, y = subgeom.x, subgeom.y
-                                features.append({
-                                    'type': 'Feature',
-                                    'geometry': {
-                                        'type': 'Point',
-                                        'coordinates': [float(x), float(y)]
-                                    },
-                                    'properties': properties
-                                })
+                                elif subgeom.geom_type == 'Point':
+                                    x, y = subgeom.x, subgeom.y
+                                    features.append({
+                                        'type': 'Feature',
+                                        'geometry': {
+                                            'type': 'Point',
+                                            'coordinates': [float(x), float(y)]
+                                        },
+                                        'properties': properties
+                                    })
                     
-                    logger.info(f"Successfully processed feature {idx}")
+                        logger.info(f"Successfully processed feature {idx}")
                     
-                except Exception as e:
-                    logger.error(f"Error processing feature {idx}: {str(e)}")
-                    continue
-                    
-            if not features:
+                    except Exception as e:
+                        logger.error(f"Error processing feature {idx}: {str(e)}")
+                        continue
+
+                if not features:
+                    return None
+
+                logger.info(f"Successfully processed {len(features)} features")
+
+                return {
+                    'type': 'FeatureCollection',
+                    'features': features
+                }
+
+            if positions is not None:
+                # Viewport results vary with every pan, so they are serialized but not cached;
+                # an empty viewport is a valid, empty collection
+                return geojson_response(request, build() or {'type': 'FeatureCollection', 'features': []})
+
+            response = cached_geojson_response(request, shapefile_path, {'lod': level}, build)
+            if response is None:
                 logger.error("No valid features were processed")
                 return JsonResponse({'error': 'No valid features found in shapefile'}, status=400)
-                
-            logger.info(f"Successfully processed {len(features)} features")
-            
-            geojson = {
-                'type': 'FeatureCollection',
-                'features': features
-            }
-                
-            return JsonResponse(geojson)
+
+            return response
             
         else:
             logger.error(f"Invalid category ({category}) or subcategory ({subcategory})")